@@ -7,8 +7,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(BASE_DIR)
 import os
 import streamlit as st
-from langchain_chroma import Chroma
-from retrieval.pipeline import Pipeline
+from retrieval.pipeline_config import create_pipeline, CHROMA_PATH, KEYWORD_INDEX_PATH, WARM_CACHE_PATH
 from study_setup import initialize_study, run_study_interface
 from app_utils import setup_page_config
 
@@ -18,20 +17,22 @@ os.environ["STREAMLIT_WATCHER"] = "false"
 
 device = "cuda"
 @st.cache_resource
-def load_pipeline(chroma_path, keyword_index_path):
-    return Pipeline(chroma_path, keyword_index_path)
-
-@st.cache_resource
-def load_vectorstore(chroma_path):
-    return Chroma(persist_directory=chroma_path)
+def load_pipeline(chroma_path, keyword_index_path, warm_cache_path=None, index_address=None):
+    return create_pipeline(
+        chroma_path,
+        keyword_index_path,
+        warm_cache_path=warm_cache_path,
+        index_address=index_address
+    )
 
 def main():
     """Main application entry point"""
     setup_page_config()
-    chroma_path = os.path.join(BASE_DIR, "data", "data_embedded")
-    keyword_index_path = os.path.join(BASE_DIR, "data", "data_indexed")
-    pipeline = load_pipeline(chroma_path, keyword_index_path)
-    vectorstore = load_vectorstore(chroma_path)
+    # With RAG_INDEX_SOCKET set, all workers share the indexes of one index server process
+    # (RAG_INDEX_AUTHKEY must be set to the server's secret)
+    index_address = os.environ.get("RAG_INDEX_SOCKET")
+    pipeline = load_pipeline(CHROMA_PATH, KEYWORD_INDEX_PATH, WARM_CACHE_PATH, index_address)
+    vectorstore = pipeline.vectorstore
     
     initialize_study()
     
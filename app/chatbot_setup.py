@@ -1,17 +1,72 @@
+import time
 import streamlit as st
-from typing import List, Dict, Any
-
-
-def display_chat_history(chat_history: List[Any]):
-    """Display the chat history in the Streamlit UI"""
-    for entry in chat_history:
-        if isinstance(entry, dict):
-            st.chat_message("user").markdown(entry["query"])
-            st.chat_message("assistant").markdown(entry["response"])
-        elif isinstance(entry, (list, tuple)) and len(entry) == 2:
-            user_msg, assistant_msg = entry
-            st.chat_message("user").markdown(user_msg)
-            st.chat_message("assistant").markdown(assistant_msg)
+from typing import List, Dict, Any, Optional
+
+# Seconds a participant should wait at most for a response
+QUERY_TIME_BUDGET = 30.0
+
+# Number of most recent exchanges rendered as individual chat messages.
+# Older exchanges stay visible inline above them, in order and with the same
+# text, but as one pre-joined markdown element ("**You:** ..." /
+# "**Assistant:** ..." without avatars), so a rerun sends a constant number
+# of elements however long the session gets. None renders every exchange as
+# its own chat message (rerun cost grows with the history).
+HISTORY_RENDER_WINDOW = 20
+
+
+def _history_messages(entry) -> List[tuple]:
+    """Convert a chat history entry into (role, markdown) pairs"""
+    if isinstance(entry, dict):
+        return [("user", entry["query"]), ("assistant", entry["response"])]
+    if isinstance(entry, (list, tuple)) and len(entry) == 2:
+        return [("user", entry[0]), ("assistant", entry[1])]
+    return []
+
+def get_render_cache(key: Any, chat_history: List[Any], window: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Return the render state of a chat history, updated incrementally.
+
+    Only entries appended since the last rerun are converted. With a `window`,
+    exchanges that fall out of it are appended once to the pre-joined markdown
+    transcript of older messages, which is then reused on every rerun.
+    """
+    caches = st.session_state.setdefault("history_render_cache", {})
+    cache = caches.get(key)
+    if cache is None or cache["entries"] > len(chat_history) or cache["window"] != window:
+        cache = {"entries": 0, "window": window, "recent": [], "archived": 0, "transcript": ""}
+        caches[key] = cache
+
+    for entry in chat_history[cache["entries"]:]:
+        cache["recent"].append(_history_messages(entry))
+    cache["entries"] = len(chat_history)
+
+    overflow = len(cache["recent"]) - window if window is not None else 0
+    if overflow > 0:
+        archived = cache["recent"][:overflow]
+        del cache["recent"][:overflow]
+        blocks = [
+            f"**{'You' if role == 'user' else 'Assistant'}:** {text}"
+            for messages in archived for role, text in messages
+        ]
+        cache["transcript"] = "\n\n".join(filter(None, [cache["transcript"]] + blocks))
+        cache["archived"] += len(archived)
+    return cache
+
+def display_chat_history(chat_history: List[Any], key: Any = None, window: Optional[int] = None):
+    """Display the chat history in the Streamlit UI (see HISTORY_RENDER_WINDOW for `window`)"""
+    cache = get_render_cache(key, chat_history, window)
+    if cache["archived"]:
+        # Older exchanges: one element instead of two chat messages per exchange
+        st.markdown(cache["transcript"])
+    for messages in cache["recent"]:
+        for role, text in messages:
+            st.chat_message(role).markdown(text)
+
+def record_render_time(history_length: int, seconds: float):
+    """Keep (history length, seconds) of recent history renders to track rerun cost"""
+    timings = st.session_state.setdefault("render_timings", [])
+    timings.append((history_length, seconds))
+    del timings[:-200]
 
 def create_chat_input(placeholder: str = "Ask a question..."):
     """Create a chat input and return the user query"""
@@ -32,15 +87,12 @@ def create_filters(vectorstore):
     if st.session_state.get("questionnaire_active", False) and st.session_state.get("current_task") != "free":
         return None
 
-    metadata, courses, semesters, lectures = get_filter_options(vectorstore)
+    courses, semesters, lectures, lectures_by_course = get_filter_options(vectorstore)
 
     selected_courses = st.sidebar.multiselect("Select Courses", options=courses, default=None)
 
-    available_lectures = []
     if selected_courses:
-        for course in selected_courses:
-            available_lectures.extend([m["lecture"] for m in metadata if m.get("course") == course])
-        available_lectures = sorted(set(available_lectures))
+        available_lectures = sorted(set().union(*(lectures_by_course.get(course, ()) for course in selected_courses)))
     else:
         available_lectures = lectures
 
@@ -54,20 +106,34 @@ def create_filters(vectorstore):
 
     return filters if filters else None
 
-@st.cache_data
+@st.cache_resource
 def get_filter_options(_vectorstore):
-    """Get filter options from the vector store metadata"""
-    metadata = _vectorstore._collection.get(include=['metadatas'])['metadatas']
-    courses = sorted(set(m.get("course", "") for m in metadata if "course" in m))
-    semesters = sorted(set(m.get("semester", "") for m in metadata if "semester" in m))
-    lectures = sorted(set(m.get("lecture", "") for m in metadata if "lecture" in m))
-    return metadata, courses, semesters, lectures
+    """
+    Get filter facets from the vector store metadata.
+
+    The metadata list is walked once per process; reruns only reuse the
+    (read-only) facet structures instead of copying the full metadata.
+    """
+    metadata = _vectorstore.get(include=['metadatas'])['metadatas']
+    courses, semesters, lectures = set(), set(), set()
+    lectures_by_course = {}
+    for m in metadata:
+        if "course" in m:
+            courses.add(m["course"])
+        if "semester" in m:
+            semesters.add(m["semester"])
+        if "lecture" in m:
+            lectures.add(m["lecture"])
+            if "course" in m:
+                lectures_by_course.setdefault(m["course"], set()).add(m["lecture"])
+    lectures_by_course = {course: tuple(sorted(names)) for course, names in lectures_by_course.items()}
+    return tuple(sorted(courses)), tuple(sorted(semesters)), tuple(sorted(lectures)), lectures_by_course
 
 
 def process_query(pipeline, query: str, search_mode: str, filters: Dict[str, Any]):
     """Process a query with the pipeline and return the result"""
     try:
-        result = pipeline.process_query(query, search_mode, filters)
+        result = pipeline.process_query(query, search_mode, filters, time_budget=QUERY_TIME_BUDGET)
         return result
     except Exception as e:
         return {"error": f"Search failed: {str(e)}"}
@@ -83,7 +149,9 @@ def handle_chat_interaction(pipeline, method, vectorstore, prompt_text, task_id)
     if task_id not in st.session_state.chat_history:
         st.session_state.chat_history[task_id] = []
 
-    display_chat_history(st.session_state.chat_history[task_id])
+    render_start = time.perf_counter()
+    display_chat_history(st.session_state.chat_history[task_id], key=task_id, window=HISTORY_RENDER_WINDOW)
+    record_render_time(len(st.session_state.chat_history[task_id]), time.perf_counter() - render_start)
 
     query = create_chat_input(prompt_text)
     if query:
@@ -105,7 +173,8 @@ def handle_chat_interaction(pipeline, method, vectorstore, prompt_text, task_id)
         st.session_state.chat_history[task_id].append({
             "query": query,
             "response": response_text,
-            "filters": flat_filters
+            "filters": flat_filters,
+            "degradations": getattr(result, "degradations", [])
         })
 
         # store for logs
@@ -144,7 +144,8 @@ def show_task_feedback():
                     {
                         "query": entry["query"],
                         "response": entry["response"],
-                        "filters": entry["filters"]
+                        "filters": entry["filters"],
+                        "degradations": entry.get("degradations", [])
                     } for entry in st.session_state.chat_history[current_task_id]
                 ],
                 "feedback": feedback
@@ -212,7 +213,8 @@ def show_free_exploration(pipeline, vectorstore):
                     {
                         "query": entry["query"],
                         "response": entry["response"],
-                        "filters": entry["filters"]
+                        "filters": entry["filters"],
+                        "degradations": entry.get("degradations", [])
                     } for entry in st.session_state.chat_history["free"]
                 ]
             })
@@ -0,0 +1,66 @@
+class AdaptiveK:
+    """
+    Chooses how many documents to keep from the score distribution of the hits.
+
+    A crisp factual query typically has a few strong hits followed by a clear
+    drop ("knee"); only the hits before the knee are kept. Broad queries have
+    flat top scores; then the result is widened to `max_k`. If neither is the
+    case the requested k is used, clamped to [min_k, max_k].
+    """
+
+    def __init__(self, min_k=2, max_k=8, knee_ratio=0.3, flat_ratio=0.05):
+        """
+        Parameters:
+            min_k (int): Minimum number of documents to keep.
+            max_k (int): Maximum number of documents to keep.
+            knee_ratio (float): A drop between two neighbouring hits counts as a knee
+                if it is at least this fraction of the score spread of the top `max_k` hits.
+            flat_ratio (float): Scores count as flat if their spread is below this
+                fraction of the top score.
+        """
+        self.min_k = min_k
+        self.max_k = max_k
+        self.knee_ratio = knee_ratio
+        self.flat_ratio = flat_ratio
+
+    def _is_flat(self, scores):
+        return scores[0] - scores[-1] <= self.flat_ratio * (abs(scores[0]) or 1.0)
+
+    def find_knee(self, scores):
+        """
+        Returns the number of hits before the steepest drop, or None if there is no clear knee.
+
+        Parameters:
+            scores (List[float]): Scores sorted best first (higher = better).
+        """
+        scores = scores[:self.max_k]
+        if len(scores) <= self.min_k or self._is_flat(scores):
+            return None
+        spread = scores[0] - scores[-1]
+        # On equal drops the earlier knee wins
+        best_gap, cut = max((scores[i] - scores[i + 1], -(i + 1)) for i in range(len(scores) - 1))
+        if best_gap < self.knee_ratio * spread:
+            return None
+        return max(-cut, self.min_k)
+
+    def choose(self, scores, default_k):
+        """
+        Returns the number of hits to keep.
+
+        Parameters:
+            scores (List[float]): Scores sorted best first (higher = better).
+            default_k (int): k used when the scores show neither a knee nor a plateau.
+        """
+        scores = scores[:self.max_k]
+        if len(scores) <= self.min_k:
+            return len(scores)
+        if self._is_flat(scores):
+            return len(scores)
+        knee = self.find_knee(scores)
+        if knee is not None:
+            return knee
+        return min(max(default_k, self.min_k), len(scores))
+
+    def settings(self):
+        return {"min_k": self.min_k, "max_k": self.max_k,
+                "knee_ratio": self.knee_ratio, "flat_ratio": self.flat_ratio}
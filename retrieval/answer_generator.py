@@ -1,4 +1,12 @@
+import re
 from langchain.prompts import PromptTemplate
+from retrieval.source_ref import SourceRef
+
+# Citations like [1] or [1, 3] in generated answers
+CITATION_PATTERN = re.compile(r"\[(\d+(?:\s*,\s*\d+)*)\]")
+
+# Reply the model is asked to give when the context does not help
+NO_ANSWER = "I could not find any helpful information in the database."
 
 class AnswerGenerator:
     '''
@@ -12,46 +20,43 @@ class AnswerGenerator:
         Parameters:
             llm (LLM): An instance of an LLM (e.g., OpenAI, HuggingFace).
         '''
-        
+
         self.llm = llm
 
         self.prompt_template = PromptTemplate(
             input_variables=["query", "context"],
             template=(
                 "You are a helpful assistant for students. Based on the following context, "
-                "answer the query concisely and provide references to ALL the sources you used."
+                "answer the query concisely and cite ALL the sources you used."
                 "You must analyze the entire provided context and synthesize an answer using all relevant information. "
                 "If the context includes multiple fragments, you should combine them into a complete answer rather than ignoring short segments."
 
-                "- The references **must** be listed in their original format as provided in the metadata, except the semester."
-
-                "- If multiple sources were used, list them all exactly as shown in the metadata."
-                "- Do not replace sources with 'Provided context' or any other generalization."
-                "- Use the **exact** pages, course name and lecture name from the metadata."
-                "- Only! inclue course name, lecture name and pages for the sources!"
+                "- Every context passage starts with the number of its source in square brackets, e.g. [2]."
+                "- Cite sources **only** by these numbers, directly after the statement they support, e.g. [1] or [1, 3]."
+                "- Do not write out course names, lecture names or pages and do not add a list of sources; it is added automatically."
+                "- Only cite numbers that appear in the source table."
 
 
                 "If you do not find useful or relevant information in the provided context, **DO NOT** make up an answer."
-                "Simply respond with: 'I could not find any helpful information in the database.'"
+                f"Simply respond with: '{NO_ANSWER}'"
 
                 "Example:"
+                "**Sources:**"
+                "[1] Machine Learning | Neural Networks | p. 10-12"
+                "[2] Machine Learning | Deep Learning Fundamentals | p. 30-42"
                 "**Context:**"
-                "- 'Neural networks are widely used in deep learning. (Source: ('pages': '10-12', 'course': 'Machine Learning', 'lecture': 'Neural Networks', 'semester': 'WiSe 2023'))'"
-                "- 'Backpropagation is a key algorithm for training deep neural networks. (Source: ('pages': '30-42', 'course': 'Machine Learning', 'lecture': 'Deep Learning Fundamentals', 'semester': 'WiSe 2023'))'"
+                "[1] Neural networks are widely used in deep learning."
+                "[2] Backpropagation is a key algorithm for training deep neural networks."
 
                 "**Query:**"
                 "'What is backpropagation?'"
 
                 "**Answer:**"
-                "'Backpropagation is a key algorithm for training deep neural networks by adjusting weights using gradient descent.'"
-
-                "**Sources:**"
-                "- Pages: 30-42, Course: Machine Learning, Lecture: Deep Learning Fundamentals"
+                "'Backpropagation is a key algorithm for training deep neural networks by adjusting weights using gradient descent [2].'"
 
                 "---"
 
-                "**Context:**"
-                "{context}"
+                "{context}\n"
 
                 "**Query:**"
                 "{query}"
@@ -59,6 +64,80 @@ class AnswerGenerator:
         )
         self.chain = self.prompt_template | self.llm
 
+    def number_sources(self, retrieved_docs):
+        '''
+        Assigns a number to every distinct source of the retrieved documents.
+
+        Parameters:
+            retrieved_docs (List[Document]): List of retrieved documents.
+
+        Returns:
+            Tuple[List[SourceRef], List[int]]: The sources in order of first appearance
+            (source n is at index n - 1) and the source number of each document.
+        '''
+
+        numbers = {}
+        sources = []
+        doc_numbers = []
+        for doc in retrieved_docs:
+            ref = SourceRef.from_metadata(doc.metadata)
+            if ref not in numbers:
+                sources.append(ref)
+                numbers[ref] = len(sources)
+            doc_numbers.append(numbers[ref])
+        return sources, doc_numbers
+
+    def format_context(self, retrieved_docs):
+        '''
+        Formats the retrieved documents as a numbered source table followed by
+        the passages, each tagged with its source number.
+
+        Parameters:
+            retrieved_docs (List[Document]): List of retrieved documents.
+
+        Returns:
+            str: The source table and context section of the prompt.
+        '''
+
+        sources, doc_numbers = self.number_sources(retrieved_docs)
+        source_table = [f"[{number}] {ref.short_label()}" for number, ref in enumerate(sources, start=1)]
+        passages = [f"[{number}] {doc.page_content}" for number, doc in zip(doc_numbers, retrieved_docs)]
+        return "**Sources:**\n" + "\n".join(source_table) + "\n**Context:**\n" + "\n".join(passages)
+
+    def build_prompt(self, query, retrieved_docs):
+        '''
+        Returns the full prompt text sent to the LLM (e.g. to count prompt tokens).
+        '''
+        return self.prompt_template.format(query=query, context=self.format_context(retrieved_docs))
+
+    def render_citations(self, answer, sources):
+        '''
+        Appends the sources cited by number in the answer, rendered from their records.
+
+        If the answer cites no valid number, all sources are listed so the answer is
+        never shown without its sources (except for the "could not find" reply).
+
+        Parameters:
+            answer (str): The generated answer containing citations like [1] or [1, 3].
+            sources (List[SourceRef]): The numbered sources from `number_sources`.
+
+        Returns:
+            str: The answer followed by the list of cited sources.
+        '''
+
+        cited = []
+        for match in CITATION_PATTERN.finditer(answer):
+            for number in match.group(1).split(","):
+                number = int(number)
+                if 1 <= number <= len(sources) and number not in cited:
+                    cited.append(number)
+        if not cited:
+            if not sources or NO_ANSWER.rstrip(".") in answer:
+                return answer
+            cited = list(range(1, len(sources) + 1))
+        references = "\n".join(f"- [{number}] {sources[number - 1].label()}" for number in cited)
+        return f"{answer}\n\n**Sources:**\n{references}"
+
     def generate_answer(self, query, retrieved_docs):
         '''
         Generates an answer based on the query and retrieved documents.
@@ -71,15 +150,11 @@ class AnswerGenerator:
             str: The generated answer with properly formatted sources.
         '''
 
-        formatted_context = []
-
-        for doc in retrieved_docs:
-       
-              formatted_context.append(f"- {doc.page_content} (Source: {doc.metadata})")
-        context = "\n".join(formatted_context)
+        sources, _ = self.number_sources(retrieved_docs)
+        context = self.format_context(retrieved_docs)
 
-        # Generate answer 
+        # Generate answer
         response = self.chain.invoke({"query": query, "context": context})
+        answer = response.content.strip() if hasattr(response, "content") else str(response).strip()
 
-        return response
-   
\ No newline at end of file
+        return self.render_citations(answer, sources)
@@ -0,0 +1,65 @@
+import contextvars
+import time
+
+# Deadline of the pipeline stage running in the current context (see `run_with_deadline`)
+_current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+class Deadline:
+    """
+    Time budget for a single query, shared by all pipeline stages.
+    """
+
+    def __init__(self, budget=None, clock=time.monotonic):
+        """
+        Parameters:
+            budget (float, optional): Seconds available for the query. None means no deadline.
+            clock (callable): Monotonic clock, injectable for tests.
+        """
+        self.clock = clock
+        self.start = clock()
+        self.expires_at = self.start + budget if budget is not None else None
+
+    def remaining(self):
+        """Seconds left, or None if there is no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self.clock())
+
+    def elapsed(self):
+        """Seconds since the deadline was created."""
+        return self.clock() - self.start
+
+    def allows(self, seconds):
+        """Returns True if at least `seconds` are left."""
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+    def timeout(self, reserve=0.0):
+        """
+        Timeout for the next stage, keeping `reserve` seconds for later stages.
+
+        Returns:
+            float or None: None if there is no deadline.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return max(0.0, remaining - reserve)
+
+
+
+def current_deadline():
+    """Returns the deadline of the stage running in this context, or None."""
+    return _current_deadline.get()
+
+
+def run_with_deadline(fn, deadline):
+    """
+    Runs `fn` with `deadline` as the current deadline, so scheduled LLM and
+    embedding calls made by `fn` are not admitted once the stage has timed out.
+    """
+    def run():
+        _current_deadline.set(deadline)
+        return fn()
+    return contextvars.copy_context().run(run)
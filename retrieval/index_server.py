@@ -0,0 +1,267 @@
+"""
+Shared read-only index host.
+
+Every Streamlit worker used to open its own Chroma collection (HNSW graph,
+SQLite caches) and Whoosh readers. The index server loads them once and
+serves all app workers over a Unix socket, so memory stays roughly constant
+as workers are added. Query embeddings are computed by the clients, the
+server only runs the vector and keyword searches.
+
+Run it next to the app, with the same secret RAG_INDEX_AUTHKEY for both:
+    RAG_INDEX_AUTHKEY=... python -m retrieval.index_server --socket /tmp/rag-index.sock
+and start the app with RAG_INDEX_SOCKET=/tmp/rag-index.sock and RAG_INDEX_AUTHKEY=...
+"""
+import argparse
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+
+from langchain_chroma import Chroma
+from langchain_core.vectorstores import VectorStore
+
+from retrieval.deadline import current_deadline
+from retrieval.keyword_retriever import KeywordRetriever
+from retrieval.page_aggregator import PageAggregator, load_or_build_doc_store
+from retrieval.warm_cache import keyword_index_fingerprint
+
+
+def authkey():
+    """
+    Returns the shared secret that authenticates connections to the index server.
+
+    Requests and results are pickled, so connections must not be accepted
+    from anyone who does not know the key; there is no default.
+    """
+    key = os.environ.get("RAG_INDEX_AUTHKEY")
+    if not key:
+        raise RuntimeError("Set RAG_INDEX_AUTHKEY to the secret shared by the index server and the app.")
+    return key.encode("utf-8")
+
+
+class IndexServer:
+    """
+    Loads the Chroma and Whoosh indexes once and answers search requests from app workers.
+    """
+
+    def __init__(self, chroma_path, keyword_index_path, doc_store_path=None):
+        """
+        Parameters:
+            chroma_path (str): Path to the Chroma database.
+            keyword_index_path (str): Path to the Whoosh index.
+            doc_store_path (str, optional): Precomputed page doc-store used for page aggregation.
+        """
+        self.vectorstore = Chroma(persist_directory=chroma_path)
+        self.keyword_retriever = KeywordRetriever(index_dir=keyword_index_path)
+        self.page_aggregator = PageAggregator(load_or_build_doc_store(
+            self.keyword_retriever.ix, doc_store_path, keyword_index_fingerprint(keyword_index_path)
+        ))
+        metadata = self.vectorstore._collection.metadata or {}
+        self.distance = metadata.get("hnsw:space", "l2")
+
+    def info(self):
+        return {"distance": self.distance}
+
+    def search_by_vector(self, embedding, k=4, filter=None):
+        return self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+
+    def get(self, **kwargs):
+        return self.vectorstore.get(**kwargs)
+
+    def keyword_search(self, query, top_k=5, **filters):
+        return self.keyword_retriever.search(query, top_k=top_k, **filters)
+
+    def keyword_search_scored(self, query, top_k=5, **filters):
+        return self.keyword_retriever.search_scored(query, top_k=top_k, **filters)
+
+    def aggregate_pages(self, docs, k):
+        return self.page_aggregator.aggregate(docs, k)
+
+    METHODS = ("info", "search_by_vector", "get", "keyword_search", "keyword_search_scored", "aggregate_pages")
+
+    def handle(self, conn):
+        """Serves requests of one client connection until it is closed."""
+        with conn:
+            while True:
+                try:
+                    method, kwargs = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    if method not in self.METHODS:
+                        raise ValueError(f"Unknown index server method: {method}")
+                    reply = (True, getattr(self, method)(**kwargs))
+                except Exception as e:
+                    reply = (False, e)
+                if not self._send(conn, reply):
+                    return
+
+    @staticmethod
+    def _send(conn, reply):
+        """Sends a reply; returns False if the client has dropped the connection."""
+        try:
+            conn.send(reply)
+        except (OSError, EOFError):
+            return False
+        except Exception as e:
+            # The result or the exception cannot be pickled: send its description instead
+            ok, value = reply
+            try:
+                conn.send((False, RuntimeError(repr(e) if ok else repr(value))))
+            except (OSError, EOFError):
+                return False
+        return True
+
+    def serve(self, address):
+        """Accepts client connections on `address` (a Unix socket path) forever."""
+        if os.path.exists(address):
+            os.remove(address)
+        with Listener(address, family="AF_UNIX", authkey=authkey()) as listener:
+            os.chmod(address, 0o600)
+            print(f"Index server listening on {address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+class IndexClient:
+    """
+    Connection to the index server; each thread uses its own connection.
+    """
+
+    def __init__(self, address, timeout=30.0):
+        """
+        Parameters:
+            address (str): Unix socket path of the index server.
+            timeout (float): Seconds to wait for an answer; shortened to the
+                deadline of the current pipeline stage.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._authkey = authkey()
+        self._local = threading.local()
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def call(self, method, **kwargs):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, family="AF_UNIX", authkey=self._authkey)
+        timeout = self.timeout
+        deadline = current_deadline()
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        try:
+            conn.send((method, kwargs))
+            if not conn.poll(timeout):
+                # A late answer would be read by the next call: reconnect instead.
+                self._drop_connection()
+                raise TimeoutError(f"Index server did not answer {method} within {timeout:.1f}s.")
+            ok, result = conn.recv()
+        except (EOFError, OSError):
+            # Server restarted: drop the connection so the next call reconnects.
+            self._drop_connection()
+            raise
+        if not ok:
+            raise result
+        return result
+
+
+class RemoteVectorStore(VectorStore):
+    """
+    Read-only vector store backed by the index server.
+    """
+
+    def __init__(self, client, embedding_function):
+        """
+        Parameters:
+            client (IndexClient): Connection to the index server.
+            embedding_function (Embeddings): Embeds queries on the client side.
+        """
+        self.client = client
+        self.embedding_function = embedding_function
+        self.distance = client.call("info")["distance"]
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        embedding = self.embedding_function.embed_query(query)
+        return self.client.call("search_by_vector", embedding=embedding, k=k, filter=filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        if self.distance == "cosine":
+            return self._cosine_relevance_score_fn
+        if self.distance == "ip":
+            return self._max_inner_product_relevance_score_fn
+        return self._euclidean_relevance_score_fn
+
+    def get(self, **kwargs):
+        return self.client.call("get", **kwargs)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("The shared index is read-only.")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("The shared index is read-only.")
+
+
+class RemoteKeywordRetriever:
+    """
+    KeywordRetriever counterpart that searches through the index server.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def search(self, query, semester=None, course=None, lecture=None, top_k=5):
+        return self.client.call(
+            "keyword_search", query=query, semester=semester, course=course, lecture=lecture, top_k=top_k
+        )
+
+    def search_scored(self, query, semester=None, course=None, lecture=None, top_k=5):
+        return self.client.call(
+            "keyword_search_scored", query=query, semester=semester, course=course, lecture=lecture, top_k=top_k
+        )
+
+
+class RemotePageAggregator:
+    """
+    PageAggregator counterpart; the doc-store stays in the index server.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def aggregate(self, docs, k):
+        return self.client.call("aggregate_pages", docs=docs, k=k)
+
+
+def main():
+    from retrieval.pipeline_config import doc_store_path_for
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Serve the Chroma and Whoosh indexes to app workers.")
+    parser.add_argument("--socket", default=os.environ.get("RAG_INDEX_SOCKET", "/tmp/rag-index.sock"))
+    parser.add_argument("--chroma-path", default=os.path.join(base_dir, "data", "data_embedded"))
+    parser.add_argument("--keyword-index-path", default=os.path.join(base_dir, "data", "data_indexed"))
+    parser.add_argument("--doc-store-path",
+                        help="Precomputed page doc-store; built from the Whoosh index if missing "
+                             "(default: doc_store.json next to the keyword index)")
+    args = parser.parse_args()
+    if args.doc_store_path is None:
+        args.doc_store_path = doc_store_path_for(args.keyword_index_path)
+    authkey()  # fail before loading the indexes if the secret is missing
+    IndexServer(args.chroma_path, args.keyword_index_path, args.doc_store_path).serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
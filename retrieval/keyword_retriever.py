@@ -3,6 +3,7 @@ from whoosh.index import open_dir
 from whoosh.query import And, Term
 from textblob import TextBlob  
 from langchain.schema import Document 
+from retrieval.source_ref import SourceRef
 
 
 
@@ -19,6 +20,15 @@ class KeywordRetriever:
         return str(TextBlob(query).correct())
 
     def search(self, query, semester=None, course=None, lecture=None, top_k=5):
+        """
+        Performs a keyword-based search, see `search_scored`.
+
+        Returns:
+            List[Document]: Retrieved documents in a structured format.
+        """
+        return [doc for doc, _ in self.search_scored(query, semester, course, lecture, top_k)]
+
+    def search_scored(self, query, semester=None, course=None, lecture=None, top_k=5):
         """
         Performs a keyword-based search with:
         - Spelling correction
@@ -34,7 +44,7 @@ class KeywordRetriever:
             top_k (int): Number of results to return.
 
         Returns:
-            List[Dict]: Retrieved documents in a structured format.
+            List[Tuple[Document, float]]: Retrieved documents with their BM25F scores, best first.
         """
         with self.ix.searcher() as searcher: 
             corrected_query = self.correct_spelling(query)
@@ -78,16 +88,13 @@ class KeywordRetriever:
             formatted_results = []
             for hit in results:
                 metadata = {
-                "course": hit.get("course", "Unknown Course"),
-                "lecture": hit.get("lecture", "Unknown Lecture"),
-                "semester": hit.get("semester", "Unknown Semester"),
-                "page": hit.get("page", "Unknown Page"),
+                "source_ref": SourceRef.get(hit.get("course"), hit.get("lecture"), hit.get("semester"), hit.get("page")),
                 "header": hit.get("header", "")
                 }
 
-                formatted_results.append(Document(
+                formatted_results.append((Document(
                     page_content=hit["content"], 
                     metadata=metadata
-                ))
+                ), hit.score))
 
         return formatted_results
\ No newline at end of file
@@ -0,0 +1,295 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable
+
+from retrieval.deadline import current_deadline
+
+# Lower value = served first. Answer generation is what the participant is
+# waiting for, multiquery expansion is optional and can be dropped.
+PRIORITY_ANSWER = 0
+PRIORITY_EMBEDDING = 1
+PRIORITY_MULTIQUERY = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_ANSWER: "answer",
+    PRIORITY_EMBEDDING: "embedding",
+    PRIORITY_MULTIQUERY: "multiquery",
+}
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token) used for rate limiting."""
+    return max(1, len(str(text)) // 4)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        """
+        Parameters:
+            rate_per_minute (float): Refill rate; None disables the limit.
+            capacity (float, optional): Burst size, defaults to one minute of refill.
+            clock (callable): Monotonic clock, injectable for tests.
+        """
+        self.rate = rate_per_minute / 60.0 if rate_per_minute else None
+        self.capacity = capacity if capacity is not None else (rate_per_minute or 0)
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        if self.rate:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Returns seconds until `amount` is available (0 if available now)."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)  # oversized requests must not starve
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        """Takes `amount` from the bucket. Negative amounts return tokens."""
+        if not self.rate:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - min(amount, self.capacity))
+
+
+class LLMScheduler:
+    """
+    Shares the capacity of one model between all participants of the study.
+
+    Provider limits apply per model, so every model (e.g. the chat model and
+    the embedding model) gets its own scheduler. Calls are admitted in
+    priority order once a concurrency slot is free and both the request and
+    token buckets allow them. Time spent waiting is recorded per priority so
+    queueing can be told apart from provider latency.
+    """
+
+    def __init__(self, max_concurrency=4, requests_per_minute=None, tokens_per_minute=None,
+                 degrade_queue_depth=8, clock=time.monotonic, wait=None):
+        """
+        Parameters:
+            max_concurrency (int): Maximum number of calls in flight.
+            requests_per_minute (int, optional): Provider request limit of the model (None = unlimited).
+            tokens_per_minute (int, optional): Provider token limit of the model (None = unlimited).
+            degrade_queue_depth (int): Queue depth from which optional calls are skipped.
+            clock (callable): Monotonic clock, injectable for tests.
+            wait (callable, optional): `wait(condition, timeout)` blocks until the condition is
+                notified or `timeout` seconds (None = no limit) have passed. Injected together
+                with a fake `clock`, it lets tests advance time instead of sleeping.
+        """
+        self.max_concurrency = max_concurrency
+        self.degrade_queue_depth = degrade_queue_depth
+        self.clock = clock
+        self._wait = wait or (lambda condition, timeout: condition.wait(timeout))
+        self.request_bucket = TokenBucket(requests_per_minute, clock=clock)
+        self.token_bucket = TokenBucket(tokens_per_minute, clock=clock)
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = 0
+        self._waits = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+        self._completed = {priority: 0 for priority in PRIORITY_NAMES}
+        self._skipped_multiquery = 0
+        self._expired = 0
+
+    def queue_depth(self):
+        """Number of calls currently waiting for admission."""
+        with self._cond:
+            return len(self._queue)
+
+    def should_skip_multiquery(self):
+        """
+        Returns True when the queue is too deep to afford optional multiquery expansion.
+        """
+        with self._cond:
+            skip = len(self._queue) >= self.degrade_queue_depth
+            if skip:
+                self._skipped_multiquery += 1
+            return skip
+
+    def _acquire(self, priority, tokens, deadline=None, min_remaining=0.0):
+        entry = (priority, next(self._counter))
+        enqueued = self.clock()
+        with self._cond:
+            if deadline is not None and deadline.remaining() <= min_remaining:
+                self._expired += 1
+                raise TimeoutError("Not enough time left before the deadline to start the call.")
+            heapq.heappush(self._queue, entry)
+            while True:
+                # Seconds the call may still wait and be started in time
+                remaining = deadline.remaining() - min_remaining if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    # The call could not finish in time: leave the queue without using capacity
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._expired += 1
+                    self._cond.notify_all()
+                    raise TimeoutError("Not enough time left before the deadline to start the call.")
+                if self._queue[0] == entry and self._running < self.max_concurrency:
+                    wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(tokens))
+                    if wait == 0:
+                        break
+                    self._wait(self._cond, wait if remaining is None else min(wait, remaining))
+                else:
+                    self._wait(self._cond, remaining)
+            heapq.heappop(self._queue)
+            self._running += 1
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            self._waits.setdefault(priority, deque(maxlen=1000)).append(self.clock() - enqueued)
+            # The next entry in line may now be admissible as well.
+            self._cond.notify_all()
+
+    def _release(self, priority):
+        with self._cond:
+            self._running -= 1
+            self._completed[priority] = self._completed.get(priority, 0) + 1
+            self._cond.notify_all()
+
+    def submit(self, fn, priority=PRIORITY_ANSWER, tokens=1, deadline=None, min_remaining=0.0):
+        """
+        Runs `fn` once it is admitted and returns its result.
+
+        Parameters:
+            fn (callable): The call to make, e.g. `lambda: llm.invoke(prompt)`.
+            priority (int): One of the PRIORITY_* constants.
+            tokens (int): Estimated tokens consumed by the call.
+            deadline (Deadline, optional): Calls are not admitted after the deadline
+                has passed; defaults to the deadline of the current pipeline stage.
+            min_remaining (float): Seconds that must be left before the deadline for
+                the call to be started (about the time the call needs).
+
+        Returns:
+            Whatever `fn` returns.
+
+        Raises:
+            TimeoutError: If less than `min_remaining` seconds are left before the
+                call is admitted; the call is counted as expired.
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        self._acquire(priority, tokens, deadline, min_remaining)
+        try:
+            return fn()
+        finally:
+            self._release(priority)
+
+    def adjust_tokens(self, delta):
+        """Corrects the token bucket once the real usage of a call is known."""
+        with self._cond:
+            self.token_bucket.consume(delta)
+
+    def stats(self):
+        """
+        Returns queue-time metrics per priority.
+
+        Returns:
+            dict: Current queue depth, calls in flight, skipped multiquery
+            expansions, calls dropped because their deadline passed and
+            count / mean / p95 / max wait (seconds) per priority.
+        """
+        with self._cond:
+            per_priority = {}
+            for priority, waits in self._waits.items():
+                ordered = sorted(waits)
+                per_priority[PRIORITY_NAMES.get(priority, str(priority))] = {
+                    "completed": self._completed.get(priority, 0),
+                    "mean_wait": sum(ordered) / len(ordered) if ordered else 0.0,
+                    # nearest rank, so small samples do not understate the tail
+                    "p95_wait": ordered[math.ceil(0.95 * len(ordered)) - 1] if ordered else 0.0,
+                    "max_wait": ordered[-1] if ordered else 0.0,
+                }
+            return {
+                "queue_depth": len(self._queue),
+                "in_flight": self._running,
+                "skipped_multiquery": self._skipped_multiquery,
+                "expired": self._expired,
+                "priorities": per_priority,
+            }
+
+
+class ScheduledLLM(Runnable):
+    """
+    Runnable wrapper that routes every call of a chat model through an LLMScheduler.
+
+    It can be used wherever the wrapped model was used, e.g. `prompt | llm`
+    chains or `MultiQueryRetriever.from_llm`.
+    """
+
+    def __init__(self, llm, scheduler, priority=PRIORITY_ANSWER, expected_output_tokens=512, min_remaining=0.0):
+        """
+        Parameters:
+            llm (Runnable): The chat model (or any fake with an `invoke` method).
+            scheduler (LLMScheduler): The shared scheduler.
+            priority (int): Priority used for all calls of this wrapper.
+            expected_output_tokens (int): Output tokens reserved per call.
+            min_remaining (float): Seconds that must be left before the current stage's
+                deadline to start a call; calls that cannot finish in time are rejected.
+        """
+        self.llm = llm
+        self.scheduler = scheduler
+        self.priority = priority
+        self.expected_output_tokens = expected_output_tokens
+        self.min_remaining = min_remaining
+
+    def invoke(self, input, config=None, **kwargs):
+        estimated = estimate_tokens(input) + self.expected_output_tokens
+        response = self.scheduler.submit(
+            lambda: self.llm.invoke(input, config, **kwargs),
+            priority=self.priority,
+            tokens=estimated,
+            min_remaining=self.min_remaining
+        )
+        usage = getattr(response, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            self.scheduler.adjust_tokens(usage["total_tokens"] - estimated)
+        return response
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that routes embedding requests through an LLMScheduler.
+    """
+
+    def __init__(self, embeddings, scheduler, priority=PRIORITY_EMBEDDING):
+        """
+        Parameters:
+            embeddings (Embeddings): The embedding model to wrap.
+            scheduler (LLMScheduler): The shared scheduler.
+            priority (int): Priority used for all embedding calls.
+        """
+        self.embeddings = embeddings
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def embed_documents(self, texts):
+        return self.scheduler.submit(
+            lambda: self.embeddings.embed_documents(texts),
+            priority=self.priority,
+            tokens=sum(estimate_tokens(text) for text in texts)
+        )
+
+    def embed_query(self, text):
+        return self.scheduler.submit(
+            lambda: self.embeddings.embed_query(text),
+            priority=self.priority,
+            tokens=estimate_tokens(text)
+        )
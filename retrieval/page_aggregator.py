@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+
+from langchain.schema import Document
+
+from retrieval.source_ref import SourceRef
+
+logger = logging.getLogger(__name__)
+
+
+def page_key(metadata):
+    """
+    Returns the (course, lecture, page) key a chunk belongs to.
+    """
+    ref = SourceRef.from_metadata(metadata)
+    return (ref.course, ref.lecture, ref.page)
+
+
+class DocStore:
+    """
+    Ordered chunk texts per (course, lecture, page), used to expand hits to their parent page.
+    """
+
+    def __init__(self, pages=None, version=None):
+        """
+        Parameters:
+            pages (dict, optional): Maps (course, lecture, page) to the list of chunk texts in index order.
+            version (str, optional): Fingerprint of the keyword index the doc-store was built from.
+        """
+        self.pages = pages or {}
+        self.version = version
+
+    @classmethod
+    def from_whoosh(cls, ix, version=None):
+        """
+        Builds the doc-store from the stored fields of a Whoosh index.
+
+        Parameters:
+            ix (whoosh.index.Index): The keyword index.
+            version (str, optional): Fingerprint of the keyword index.
+        """
+        pages = {}
+        with ix.searcher() as searcher:
+            for fields in searcher.all_stored_fields():
+                pages.setdefault(page_key(fields), []).append(fields.get("content", ""))
+        return cls(pages, version)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls({tuple(entry["key"]): entry["chunks"] for entry in data["pages"]}, data.get("version"))
+
+    def save(self, path):
+        data = {
+            "version": self.version,
+            "pages": [{"key": list(key), "chunks": chunks} for key, chunks in self.pages.items()],
+        }
+        # Write to a temporary file first, so processes starting at the same time never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def chunks(self, key):
+        return self.pages.get(key, [])
+
+
+class PageAggregator:
+    """
+    Groups retrieved chunks by lecture page and expands the best pages.
+
+    Several top-k slots often go to sibling chunks of the same page. Hits are
+    therefore grouped by (course, lecture, page); groups are scored by the
+    reciprocal ranks of their hits, and each of the top-k groups is replaced by
+    its whole page or, for long pages, by a window of neighbouring chunks
+    around its hits.
+    """
+
+    def __init__(self, doc_store, max_page_chars=4000, window=1):
+        """
+        Parameters:
+            doc_store (DocStore): Chunk texts per page, loaded before the first query
+                (see `load_or_build_doc_store`).
+            max_page_chars (int): Pages up to this length are included completely.
+            window (int): Neighbouring chunks included on each side of a hit for longer pages.
+        """
+        self.doc_store = doc_store
+        self.max_page_chars = max_page_chars
+        self.window = window
+
+    def group(self, docs):
+        """
+        Groups ranked documents by page.
+
+        Returns:
+            List[Tuple[float, tuple, List[Document]]]: (score, key, hits), best group first.
+        """
+        groups = {}
+        for rank, doc in enumerate(docs):
+            key = page_key(doc.metadata)
+            score, hits = groups.get(key, (0.0, []))
+            hits.append(doc)
+            groups[key] = (score + 1.0 / (rank + 1), hits)
+        # sorted() is stable, so ties keep the order of the best hit
+        return sorted(((score, key, hits) for key, (score, hits) in groups.items()), key=lambda g: -g[0])
+
+    def expand(self, key, hits):
+        """
+        Returns the text for a page group: the full page if it is short enough,
+        otherwise the hits plus `window` neighbouring chunks.
+        """
+        chunks = self.doc_store.chunks(key)
+        hit_texts = list(dict.fromkeys(doc.page_content for doc in hits))
+        positions = [chunks.index(text) for text in hit_texts if text in chunks]
+        if not positions:
+            return "\n".join(hit_texts)
+
+        if sum(len(chunk) for chunk in chunks) <= self.max_page_chars:
+            selected = range(len(chunks))
+        else:
+            selected = sorted({
+                i for pos in positions
+                for i in range(max(0, pos - self.window), min(len(chunks), pos + self.window + 1))
+            })
+        parts = []
+        previous = None
+        for i in selected:
+            if previous is not None and i != previous + 1:
+                parts.append("...")
+            parts.append(chunks[i])
+            previous = i
+        # Hits that are not part of the doc-store (e.g. differently chunked) are kept as they are
+        parts.extend(text for text in hit_texts if text not in chunks)
+        return "\n".join(parts)
+
+    def aggregate(self, docs, k):
+        """
+        Turns ranked chunk hits into at most `k` expanded page documents.
+
+        Parameters:
+            docs (List[Document]): Ranked retrieval hits (best first).
+            k (int): Number of page documents to return.
+
+        Returns:
+            List[Document]: One document per page, carrying the metadata of the
+            page's best hit plus the number of hits in "chunk_hits".
+        """
+        aggregated = []
+        for score, key, hits in self.group(docs)[:k]:
+            metadata = dict(hits[0].metadata)
+            metadata["chunk_hits"] = len(hits)
+            aggregated.append(Document(page_content=self.expand(key, hits), metadata=metadata))
+        return aggregated
+
+
+def load_or_build_doc_store(ix, path=None, version=None):
+    """
+    Loads the precomputed doc-store from `path`, or builds it from the Whoosh
+    index and saves it there if the file is missing or was built from another
+    index version.
+
+    Called at startup, so the scan of the Whoosh stored fields never runs
+    inside a participant's query. An unreadable file is rebuilt as well.
+    """
+    if path and os.path.exists(path):
+        try:
+            doc_store = DocStore.load(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Rebuilding unreadable doc-store %s: %s", path, e)
+        else:
+            if doc_store.version == version:
+                return doc_store
+            logger.info("Rebuilding stale doc-store %s.", path)
+    doc_store = DocStore.from_whoosh(ix, version)
+    if path:
+        try:
+            doc_store.save(path)
+        except OSError as e:
+            logger.warning("Could not save the doc-store to %s: %s", path, e)
+    return doc_store
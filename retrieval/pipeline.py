@@ -1,40 +1,153 @@
 
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from retrieval.rag_retriever import Retriever
 from retrieval.answer_generator import AnswerGenerator
 from retrieval.keyword_retriever import KeywordRetriever
+from retrieval.llm_scheduler import (
+    LLMScheduler, ScheduledLLM, ScheduledEmbeddings,
+    PRIORITY_ANSWER, PRIORITY_MULTIQUERY
+)
+from retrieval.deadline import Deadline, run_with_deadline
+from retrieval.result_cache import ResultCache
+from retrieval.page_aggregator import PageAggregator, load_or_build_doc_store
+from retrieval.warm_cache import WarmCache, index_version, keyword_index_fingerprint
+from retrieval.source_ref import SourceRef
+from retrieval.index_server import IndexClient, RemoteVectorStore, RemoteKeywordRetriever, RemotePageAggregator
+from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 import streamlit as st 
-openai_api_key = st.secrets["openAI"]["open_ai_key"]
+
+logger = logging.getLogger(__name__)
+
+
+def format_sources(docs, snippet_length=300):
+    """Formats retrieved documents as a plain source list (used when no answer is synthesized)."""
+    lines = []
+    for doc in docs:
+        snippet = " ".join(doc.page_content.split())
+        if len(snippet) > snippet_length:
+            snippet = snippet[:snippet_length].rstrip() + "..."
+        lines.append(f"- {snippet} ({SourceRef.from_metadata(doc.metadata).label()})")
+    return "\n".join(lines)
+
+
+SOURCES_ONLY_NOTE = "An answer could not be generated in time. These are the most relevant sources:\n\n"
+
+
+class PipelineResponse:
+    """
+    Result of `Pipeline.process_query`.
+
+    Attributes:
+        content (str): Text shown to the user.
+        sources (List[Document]): Documents the answer is based on.
+        degradations (List[str]): Fallbacks applied to stay within the time budget
+            or to recover from failing stages, e.g. "multiquery_skipped_deadline",
+            "keyword_fallback" or "synthesis_skipped". Empty if the query ran normally.
+        metadata (dict): Further details such as the search mode and elapsed time.
+    """
+
+    def __init__(self, content, sources=None, degradations=None, metadata=None):
+        self.content = content
+        self.sources = sources or []
+        self.degradations = degradations or []
+        self.metadata = metadata or {}
+
+    def __str__(self):
+        return self.content
+
 
 class Pipeline:
-    def __init__(self, chroma_path, keyword_index_path):
+    # Seconds that must be left for the optional multiquery expansion and for answer synthesis.
+    multiquery_min_budget = 8.0
+    synthesis_min_budget = 4.0
+
+    # Chunk hits fetched per returned document when results are aggregated by page.
+    page_candidates_factor = 3
+
+    def __init__(self, chroma_path, keyword_index_path, embedding_model=None, model=None, scheduler=None,
+                 embedding_scheduler=None, aggregate_pages=True, doc_store_path=None, warm_cache_path=None,
+                 index_address=None, adaptive_k=None):
         """
         Initialize the pipeline with paths for both RAG (ChromaDB) and keyword search (Whoosh).
 
         Parameters:
             chroma_path (str): Path to the Chroma database for RAG.
             keyword_index_path (str): Path to the Whoosh index for keyword search.
+            embedding_model (Embeddings, optional): Embedding model, defaults to OpenAI text-embedding-3-large.
+            model (LLM, optional): Chat model, defaults to OpenAI gpt-4o.
+            scheduler (LLMScheduler, optional): Scheduler for the chat model's calls.
+            embedding_scheduler (LLMScheduler, optional): Scheduler for the embedding model's
+                calls; separate so slow answers cannot hold the slots retrieval needs.
+            aggregate_pages (bool): Group hits by lecture page and expand them to their parent page.
+            doc_store_path (str, optional): Precomputed page doc-store (JSON), loaded at startup;
+                built from the Whoosh index and written there if missing.
+            warm_cache_path (str, optional): Precomputed results for the study tasks (see
+                tools/warm_cache.py); ignored if it was built against other indexes.
+            index_address (str, optional): Socket of a shared index server (see retrieval/index_server.py).
+                If given, the indexes are not loaded in this process.
+            adaptive_k (AdaptiveK, optional): Choose the number of documents from the score
+                distribution instead of always using k.
         """
         self.chroma_path = chroma_path
         self.keyword_index_path = keyword_index_path 
-        
-        self.embedding_model_OA = OpenAIEmbeddings(model="text-embedding-3-large", openai_api_key= openai_api_key) 
-        self.model = ChatOpenAI(model="gpt-4o", openai_api_key=openai_api_key) 
-        self.keyword_retriever = KeywordRetriever(index_dir=keyword_index_path)  
+
+        if embedding_model is None or model is None:
+            openai_api_key = st.secrets["openAI"]["open_ai_key"]
+        if embedding_model is None:
+            embedding_model = OpenAIEmbeddings(model="text-embedding-3-large", openai_api_key=openai_api_key)
+        if model is None:
+            model = ChatOpenAI(model="gpt-4o", openai_api_key=openai_api_key)
+
+        self.scheduler = scheduler or LLMScheduler()
+        self.embedding_scheduler = embedding_scheduler or LLMScheduler()
+        self.embedding_model_OA = ScheduledEmbeddings(embedding_model, self.embedding_scheduler)
+        # Answers that cannot be generated before the deadline are not started
+        self.model = ScheduledLLM(
+            model, self.scheduler, priority=PRIORITY_ANSWER, min_remaining=self.synthesis_min_budget
+        )
+        self.multiquery_model = ScheduledLLM(model, self.scheduler, priority=PRIORITY_MULTIQUERY)
         self.rag_retriever = None  
+        self.page_aggregator = None
+        if index_address:
+            index_client = IndexClient(index_address)
+            self.vectorstore = RemoteVectorStore(index_client, self.embedding_model_OA)
+            self.keyword_retriever = RemoteKeywordRetriever(index_client)
+            if aggregate_pages:
+                self.page_aggregator = RemotePageAggregator(index_client)
+        else:
+            self.vectorstore = Chroma(persist_directory=chroma_path, embedding_function=self.embedding_model_OA)
+            self.keyword_retriever = KeywordRetriever(index_dir=keyword_index_path)  
+            if aggregate_pages:
+                self.page_aggregator = PageAggregator(
+                    load_or_build_doc_store(
+                        self.keyword_retriever.ix, doc_store_path, keyword_index_fingerprint(keyword_index_path)
+                    )
+                )
+        self.adaptive_k = adaptive_k
+        self.result_cache = ResultCache()
+        self.index_version = index_version(
+            chroma_path, keyword_index_path,
+            settings={
+                "aggregate_pages": bool(aggregate_pages),
+                "adaptive_k": adaptive_k.settings() if adaptive_k else None,
+            }
+        )
+        self.warm_cache = WarmCache.load(warm_cache_path, self.index_version) if warm_cache_path else None
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline-stage")
 
     def get_rag_retriever(self, query):
         """
-        Lazily initializes the Retriever instance only when needed.
+        Creates a Retriever for the query on top of the shared vector store.
         """
-            
-        self.rag_retriever = Retriever(
-            chroma_path=self.chroma_path,
-            embedding_model=self.embedding_model_OA,
-            multiquery_llm=self.model,
+        retriever = Retriever(
+            vectorstore=self.vectorstore,
+            multiquery_llm=self.multiquery_model,
             query=query
         )
-        return self.rag_retriever
+        self.rag_retriever = retriever
+        return retriever
 
     def retrieve_rag(self, query, filters=None, multiquery=True, k=5):
         """
@@ -58,13 +171,53 @@ class Pipeline:
     def retrieve(self, query, search_mode="rag", filters=None, multiquery=True, k=5):
         """
         Dynamically chooses between RAG or keyword search based on `search_mode`.
+        With page aggregation, more chunks are fetched and merged into `k` page documents.
+        """
+        return self.retrieve_with_info(query, search_mode, filters, multiquery, k)[0]
+
+    def retrieve_with_info(self, query, search_mode="rag", filters=None, multiquery=True, k=5):
+        """
+        Like `retrieve`, but also returns retrieval details.
+
+        With adaptive k, the number of documents is chosen from the chunk scores (between
+        `adaptive_k.min_k` and `adaptive_k.max_k`) instead of always using `k`. With page
+        aggregation, that many pages are built from all fetched candidates, so slots
+        freed by merging sibling chunks are filled by the next pages.
+
+        Returns:
+            Tuple[List[Document], dict]: The documents and a dict with the number of chunks
+            kept ("chosen_k") and whether multiquery expansion stopped early.
         """
+        if search_mode not in ("rag", "keyword"):
+            raise ValueError("Invalid search mode. Choose 'rag' or 'keyword'.")
+        info = {"chosen_k": k, "multiquery_early_stop": False}
+
+        if self.adaptive_k:
+            fetch_k = self.adaptive_k.max_k
+            if self.page_aggregator:
+                fetch_k *= self.page_candidates_factor
+            if search_mode == "rag":
+                scored, info["multiquery_early_stop"] = self.get_rag_retriever(query).retrieve_scored(
+                    filters=filters, multiquery=multiquery, k=fetch_k, adaptive_k=self.adaptive_k
+                )
+            else:
+                scored = self.keyword_retriever.search_scored(query, **(filters or {}), top_k=fetch_k)
+            info["chosen_k"] = self.adaptive_k.choose([score for _, score in scored], k)
+            if self.page_aggregator:
+                docs = self.page_aggregator.aggregate([doc for doc, _ in scored], info["chosen_k"])
+            else:
+                docs = [doc for doc, _ in scored[:info["chosen_k"]]]
+            return docs, info
+
+        fetch_k = k * self.page_candidates_factor if self.page_aggregator else k
         if search_mode == "rag":
-            return self.retrieve_rag(query, filters, multiquery, k)
-        elif search_mode == "keyword":
-            return self.retrieve_keyword(query, filters, k)
+            docs = self.retrieve_rag(query, filters, multiquery, fetch_k)
         else:
-            raise ValueError("Invalid search mode. Choose 'rag' or 'keyword'.")
+            docs = self.retrieve_keyword(query, filters, fetch_k)
+
+        if self.page_aggregator:
+            docs = self.page_aggregator.aggregate(docs, k)
+        return docs, info
 
     def answer(self, query, retrieved_docs):
         """
@@ -75,22 +228,159 @@ class Pipeline:
         answer_generator = AnswerGenerator(self.model)
         return answer_generator.generate_answer(query=query, retrieved_docs=retrieved_docs)
 
-    def process_query(self, query, search_mode="rag", filters=None, multiquery=True, k=5):
+    def cache_stats(self):
+        """
+        Returns hit/miss statistics of the pipeline's caches.
+        """
+        stats = {"results": self.result_cache.stats()}
+        if self.warm_cache is not None:
+            stats["warm"] = self.warm_cache.stats()
+        return stats
+
+    def scheduler_stats(self):
+        """
+        Returns the queue statistics of the chat model and embedding schedulers.
+        """
+        return {"llm": self.scheduler.stats(), "embeddings": self.embedding_scheduler.stats()}
+
+    def _run_stage(self, fn, timeout):
+        """
+        Runs a pipeline stage, raising TimeoutError if it takes longer than `timeout` seconds.
+
+        A timed-out stage is cancelled if it has not started yet. A stage that is
+        already running cannot be interrupted; its result is discarded and its
+        LLM and embedding calls that are still queued are not admitted anymore.
+        """
+        if timeout is None:
+            return fn()
+        future = self._executor.submit(run_with_deadline, fn, Deadline(timeout))
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _retrieve_with_fallbacks(self, query, search_mode, filters, multiquery, k, deadline, degradations):
+        """
+        Retrieves documents within the deadline, falling back to cached results
+        or keyword retrieval if the selected search mode times out or fails.
+
+        Returns:
+            Tuple[List[Document], dict]: The documents and retrieval details (see `retrieve_with_info`).
+        """
+        key = ResultCache.make_key(query, search_mode, filters, multiquery, k)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            result = self._run_stage(
+                lambda: self.retrieve_with_info(query, search_mode, filters, multiquery, k),
+                deadline.timeout(reserve=self.synthesis_min_budget)
+            )
+            self.result_cache.put(key, result)
+            return result
+        except TimeoutError:
+            degradations.append(f"{search_mode}_timeout")
+        except Exception:
+            logger.exception("%s retrieval failed for query %r", search_mode, query)
+            degradations.append(f"{search_mode}_failed")
+
+        cached = self.result_cache.get_any(query, search_mode, filters)
+        if cached is not None:
+            degradations.append("cached_results")
+            return cached
+
+        if search_mode != "keyword":
+            try:
+                # Same keyword path as the keyword condition (page aggregation, adaptive k)
+                result = self._run_stage(
+                    lambda: self.retrieve_with_info(query, "keyword", filters, False, k),
+                    deadline.timeout()
+                )
+                degradations.append("keyword_fallback")
+                return result
+            except Exception:
+                logger.exception("Keyword fallback failed for query %r", query)
+                degradations.append("keyword_fallback_failed")
+        return [], {"chosen_k": k}
+
+    def process_query(self, query, search_mode="rag", filters=None, multiquery=True, k=5, time_budget=None):
         """
         Process the query using the selected retrieval method.
 
+        With a `time_budget`, every stage is given the time that is left: multiquery
+        expansion is dropped when the budget is tight or the LLM queue is congested,
+        slow or failing retrieval falls back to cached results or keyword search, and
+        the retrieved sources are returned without synthesis if generation would
+        overrun. Applied fallbacks are listed in `PipelineResponse.degradations`.
+
         Parameters:
             query (str): The user's search query.
             search_mode (str): Either "rag" or "keyword".
             filters (dict, optional): Filters for metadata-based retrieval.
             multiquery (bool): Whether to use multiquery retrieval.
             k (int): Number of top documents to return.
+            time_budget (float, optional): Seconds available for the whole query.
 
         Returns:
-            str or list: The final answer if RAG is used, or retrieved documents if keyword search is used.
+            PipelineResponse: The answer text together with its sources and degradations.
         """
-        retrieved_docs = self.retrieve(query, search_mode, filters, multiquery, k)
+        if search_mode not in ("rag", "keyword"):
+            raise ValueError("Invalid search mode. Choose 'rag' or 'keyword'.")
+        deadline = Deadline(time_budget)
+        degradations = []
 
-        answer = self.answer(query, retrieved_docs)
-        return answer
+        warm = self.warm_cache.lookup(query, search_mode, filters, k) if self.warm_cache else None
+        if warm is not None:
+            warm_docs, warm_answer = warm
+            if warm_answer is not None:
+                return PipelineResponse(
+                    content=warm_answer,
+                    sources=warm_docs,
+                    metadata={"search_mode": search_mode, "k": k, "warm_cache": "answer",
+                              "elapsed": deadline.elapsed()}
+                )
 
+        retrieval_info = {"chosen_k": k}
+        if warm is not None:
+            retrieved_docs = warm_docs
+        else:
+            if search_mode == "rag" and multiquery:
+                if not deadline.allows(self.multiquery_min_budget + self.synthesis_min_budget):
+                    multiquery = False
+                    degradations.append("multiquery_skipped_deadline")
+                elif self.scheduler.should_skip_multiquery():
+                    multiquery = False
+                    degradations.append("multiquery_skipped_queue")
+            retrieved_docs, retrieval_info = self._retrieve_with_fallbacks(
+                query, search_mode, filters, multiquery, k, deadline, degradations
+            )
+
+        if not retrieved_docs:
+            content = "No relevant documents found."
+        elif not deadline.allows(self.synthesis_min_budget):
+            degradations.append("synthesis_skipped")
+            content = SOURCES_ONLY_NOTE + format_sources(retrieved_docs)
+        else:
+            try:
+                answer = self._run_stage(lambda: self.answer(query, retrieved_docs), deadline.timeout())
+                content = answer.content if hasattr(answer, "content") else str(answer)
+            except TimeoutError:
+                degradations.append("synthesis_timeout")
+                content = SOURCES_ONLY_NOTE + format_sources(retrieved_docs)
+            except Exception:
+                logger.exception("Answer synthesis failed for query %r", query)
+                degradations.append("synthesis_failed")
+                content = SOURCES_ONLY_NOTE + format_sources(retrieved_docs)
+
+        return PipelineResponse(
+            content=content,
+            sources=retrieved_docs,
+            degradations=degradations,
+            metadata={"search_mode": search_mode, "multiquery": multiquery and search_mode == "rag", "k": k,
+                      "chosen_k": retrieval_info["chosen_k"],
+                      "multiquery_early_stop": retrieval_info.get("multiquery_early_stop", False),
+                      "warm_cache": "retrieval" if warm is not None else None,
+                      "elapsed": deadline.elapsed()}
+        )
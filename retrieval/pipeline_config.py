@@ -0,0 +1,68 @@
+"""
+Pipeline configuration shared by the app and the tools.
+
+Settings that change retrieval results (page aggregation, adaptive k) are part
+of the warm cache's index version, so the app, tools/warm_cache.py,
+tools/replay_sessions.py and tools/evaluate_retrieval.py must all build their
+pipeline through `create_pipeline` to run (and fingerprint) the same configuration.
+"""
+import os
+
+from retrieval.adaptive_k import AdaptiveK
+from retrieval.llm_scheduler import LLMScheduler
+from retrieval.pipeline import Pipeline
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHROMA_PATH = os.path.join(BASE_DIR, "data", "data_embedded")
+KEYWORD_INDEX_PATH = os.path.join(BASE_DIR, "data", "data_indexed")
+WARM_CACHE_PATH = os.path.join(BASE_DIR, "data", "warm_cache.json")
+
+
+def doc_store_path_for(keyword_index_path):
+    """Returns the doc-store path of a Whoosh index: doc_store.json next to the index directory."""
+    index_dir = os.path.abspath(keyword_index_path).rstrip(os.sep)
+    return os.path.join(os.path.dirname(index_dir), "doc_store.json")
+
+
+DOC_STORE_PATH = doc_store_path_for(KEYWORD_INDEX_PATH)
+
+# Group hits by lecture page and expand them to their parent page
+AGGREGATE_PAGES = True
+
+# Bounds for choosing the number of documents from the score distribution
+ADAPTIVE_K_MIN = 2
+ADAPTIVE_K_MAX = 8
+
+# Provider limits per model (OpenAI usage tier 1 for gpt-4o and
+# text-embedding-3-large); raise them to the limits of the account's tier.
+LLM_LIMITS = {"max_concurrency": 4, "requests_per_minute": 500, "tokens_per_minute": 30000}
+EMBEDDING_LIMITS = {"max_concurrency": 8, "requests_per_minute": 3000, "tokens_per_minute": 1000000}
+
+
+def create_adaptive_k():
+    return AdaptiveK(min_k=ADAPTIVE_K_MIN, max_k=ADAPTIVE_K_MAX)
+
+
+def create_pipeline(chroma_path=CHROMA_PATH, keyword_index_path=KEYWORD_INDEX_PATH, **kwargs):
+    """
+    Creates a Pipeline with the app's retrieval settings.
+
+    Parameters:
+        chroma_path (str): Path to the Chroma database.
+        keyword_index_path (str): Path to the Whoosh index.
+        **kwargs: Further `Pipeline` arguments (e.g. models, warm_cache_path,
+            index_address); they override the defaults of this module. The
+            doc-store defaults to the one of `keyword_index_path`.
+
+    Returns:
+        Pipeline: The configured pipeline.
+    """
+    options = {
+        "scheduler": LLMScheduler(**LLM_LIMITS),
+        "embedding_scheduler": LLMScheduler(**EMBEDDING_LIMITS),
+        "aggregate_pages": AGGREGATE_PAGES,
+        "doc_store_path": doc_store_path_for(keyword_index_path),
+        "adaptive_k": create_adaptive_k(),
+    }
+    options.update(kwargs)
+    return Pipeline(chroma_path, keyword_index_path, **options)
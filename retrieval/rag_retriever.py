@@ -1,6 +1,6 @@
-from langchain_chroma import Chroma  
 from langchain.retrievers.multi_query import MultiQueryRetriever
 from langchain.prompts import PromptTemplate
+from retrieval.source_ref import SourceRef
 
 
 class Retriever:
@@ -9,18 +9,16 @@ class Retriever:
     """
 
 
-    def __init__(self, chroma_path, embedding_model, multiquery_llm, query):
+    def __init__(self, vectorstore, multiquery_llm, query):
         """
         Initializes the Retriever.
 
         Parameters:
-            chroma_path (str): Path to the Chroma vector database.
-            embedding_model (Embeddings): The embedding model used for similarity search.
+            vectorstore (VectorStore): The shared vector store (local Chroma or a remote index handle).
             multiquery_llm (LLM): The LLM used for multiquery retrieval.
             query (str): The user query.
         """
-        self.embeddings = embedding_model
-        self.vectorstore = Chroma(persist_directory=chroma_path, embedding_function=embedding_model)
+        self.vectorstore = vectorstore
         self.query = query
         self.llm = multiquery_llm
         
@@ -63,9 +61,71 @@ class Retriever:
         adjusted_k = k * 4 
         
         retriever = self.create_retriever(filters=filters, search_type=search_type,  multiquery=multiquery, k=adjusted_k)
-        retrieved_docs = retriever.invoke(self.query)
+        retrieved_docs = retriever.invoke(self.query)[:k]  # Keep only top-k results
 
-        return retrieved_docs[:k]  # Keep only top-k results
+        return self.attach_source_refs(retrieved_docs)
+
+    def attach_source_refs(self, docs):
+        """
+        Replaces the Chroma metadata of each document by its shared SourceRef,
+        in the same compact form as the keyword retriever's results.
+        """
+        for doc in docs:
+            doc.metadata = {
+                "source_ref": SourceRef.from_metadata(doc.metadata),
+                "header": doc.metadata.get("header", "")
+            }
+        return docs
+
+    def generate_queries(self):
+        """
+        Generates the multiquery variations of the user query.
+
+        Returns:
+            List[str]: The reformulated queries.
+        """
+        chain = self.multiquery_retriever(self.vectorstore.as_retriever(), self.llm).llm_chain
+        return [q.strip() for q in chain.invoke({"question": self.query}) if q.strip()]
+
+    def retrieve_scored(self, filters=None, multiquery=True, k=5, adaptive_k=None):
+        """
+        Retrieves documents together with their relevance scores.
+
+        The original query is searched first. Multiquery variations are only
+        generated if `adaptive_k` finds no clear knee in the scores of the original
+        query; otherwise the (optional) expansion is terminated early. A document
+        found by several queries keeps its best score.
+
+        Parameters:
+            filters (dict): Metadata filters for narrowing down the search.
+            multiquery (bool): Whether to add hits of multiquery variations.
+            k (int): Number of documents fetched per query.
+            adaptive_k (AdaptiveK, optional): Enables early termination of multiquery expansion.
+
+        Returns:
+            Tuple[List[Tuple[Document, float]], bool]: Scored documents (best first) and
+            whether multiquery expansion was skipped because of a clear knee.
+        """
+        best = {}
+
+        def add_hits(query):
+            for doc, score in self.vectorstore.similarity_search_with_relevance_scores(query, k=k, filter=filters):
+                key = (doc.page_content, tuple(sorted(doc.metadata.items())))
+                if key not in best or score > best[key][1]:
+                    best[key] = (doc, score)
+
+        add_hits(self.query)
+        early_stop = False
+        if multiquery:
+            scores = sorted((score for _, score in best.values()), reverse=True)
+            early_stop = adaptive_k is not None and adaptive_k.find_knee(scores) is not None
+            if not early_stop:
+                for query in self.generate_queries():
+                    add_hits(query)
+
+        scored = sorted(best.values(), key=lambda hit: hit[1], reverse=True)
+        self.attach_source_refs([doc for doc, _ in scored])
+        return scored, early_stop
 
     def multiquery_retriever(self, retriever, llm):
         """
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+
+
+def filters_key(filters):
+    """Hashable, order-independent representation of a metadata filter dict."""
+    if not filters:
+        return ()
+    key = []
+    for field, value in sorted(filters.items()):
+        if isinstance(value, dict):
+            value = tuple(sorted((op, tuple(v) if isinstance(v, list) else v) for op, v in value.items()))
+        elif isinstance(value, list):
+            value = tuple(value)
+        key.append((field, value))
+    return tuple(key)
+
+
+def normalize_query(query):
+    """Lower-cases and collapses whitespace so trivial variations share a cache entry."""
+    return " ".join(query.lower().split())
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache for retrieval results.
+
+    Entries are stored under the exact retrieval settings. Looking up with
+    `get_any` ignores the remaining settings (multiquery, k) and returns the
+    latest results for the same query, filters and search mode, which is used
+    as a fallback when retrieval fails. Results are never shared between search
+    modes, so the study conditions stay separated.
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        Parameters:
+            max_entries (int): Number of result lists kept in memory.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query, search_mode, filters, multiquery, k):
+        return (normalize_query(query), filters_key(filters), search_mode, multiquery, k)
+
+    def get(self, key):
+        """Returns the cached documents for `key` or None."""
+        with self._lock:
+            docs = self._entries.get(key)
+            if docs is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return docs
+
+    def get_any(self, query, search_mode, filters):
+        """Returns the most recent results for the query, search mode and filters under any other settings."""
+        with self._lock:
+            key = self._latest.get((normalize_query(query), filters_key(filters), search_mode))
+            return self._entries.get(key) if key is not None else None
+
+    def put(self, key, docs):
+        with self._lock:
+            self._entries[key] = docs
+            self._entries.move_to_end(key)
+            self._latest[key[:3]] = key
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                if self._latest.get(old_key[:3]) == old_key:
+                    del self._latest[old_key[:3]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,99 @@
+import sys
+import threading
+
+
+class SourceRef:
+    """
+    Interned, immutable reference to a lecture source (course, lecture, semester, page).
+
+    There is exactly one instance per distinct source, so documents of both
+    retrievers share them instead of carrying their own metadata strings, and
+    references can be compared and grouped by identity.
+    """
+
+    __slots__ = ("course", "lecture", "semester", "page")
+
+    _interned = {}
+    _lock = threading.Lock()
+
+    def __init__(self, course, lecture, semester, page):
+        object.__setattr__(self, "course", course)
+        object.__setattr__(self, "lecture", lecture)
+        object.__setattr__(self, "semester", semester)
+        object.__setattr__(self, "page", page)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SourceRef is immutable")
+
+    @classmethod
+    def get(cls, course=None, lecture=None, semester=None, page=None):
+        """
+        Returns the shared instance for the given source fields.
+        """
+        key = tuple(sys.intern(str(value)) if value is not None else None
+                    for value in (course, lecture, semester, page))
+        ref = cls._interned.get(key)
+        if ref is None:
+            with cls._lock:
+                ref = cls._interned.setdefault(key, cls(*key))
+        return ref
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """
+        Returns the SourceRef of a document's metadata (Chroma metadata, Whoosh
+        stored fields or metadata that already carries a "source_ref").
+        """
+        ref = metadata.get("source_ref")
+        if isinstance(ref, cls):
+            return ref
+        return cls.get(
+            metadata.get("course"),
+            metadata.get("lecture"),
+            metadata.get("semester"),
+            metadata.get("page") or metadata.get("pages"),
+        )
+
+    def label(self):
+        """Citation text in the study's format: pages, course and lecture (no semester)."""
+        parts = []
+        if self.page:
+            parts.append(f"Pages: {self.page}")
+        if self.course:
+            parts.append(f"Course: {self.course}")
+        if self.lecture:
+            parts.append(f"Lecture: {self.lecture}")
+        return ", ".join(parts) or "Unknown source"
+
+    def short_label(self):
+        """Compact label used in the prompt's source table."""
+        parts = [part for part in (self.course, self.lecture) if part]
+        if self.page:
+            parts.append(f"p. {self.page}")
+        return " | ".join(parts) or "Unknown source"
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __reduce__(self):
+        # Unpickled references (e.g. from the index server) are interned again.
+        return (SourceRef.get, (self.course, self.lecture, self.semester, self.page))
+
+    def __repr__(self):
+        return f"SourceRef({self.course!r}, {self.lecture!r}, {self.semester!r}, {self.page!r})"
+
+
+def metadata_to_json(metadata):
+    """Returns a JSON-serializable copy of document metadata."""
+    ref = metadata.get("source_ref")
+    if isinstance(ref, SourceRef):
+        return dict(metadata, source_ref=ref.as_dict())
+    return metadata
+
+
+def metadata_from_json(metadata):
+    """Inverse of `metadata_to_json`."""
+    ref = metadata.get("source_ref")
+    if isinstance(ref, dict):
+        return dict(metadata, source_ref=SourceRef.get(**ref))
+    return metadata
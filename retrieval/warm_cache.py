@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+
+from langchain.schema import Document
+
+from retrieval.result_cache import filters_key, normalize_query
+from retrieval.source_ref import metadata_from_json, metadata_to_json
+
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout changes.
+WARM_CACHE_FORMAT = 2
+
+_TASK_PREFIX = re.compile(r"^\s*task\s*\d+\s*:\s*", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+
+# Words that carry no topic (question words, instructions of the study tasks),
+# left out so paraphrases of a task are matched by its content words only.
+STOP_WORDS = frozenset("""
+a about all also an and any are as at be been being but by can could did do does each explain describe
+for from give had has have he her his how i in into is it its least list may me might must my name no
+not of on or our please she should so some tell than that the their them then there these they this
+those to us was we were what when where which who whom whose why will with would you your
+""".split())
+
+
+def chroma_fingerprint(chroma_path):
+    """
+    Content fingerprint of a Chroma database: collection ids, number of
+    embeddings and the latest sequence id. Unlike file times it is the same in
+    every checkout of the same index, so a committed warm cache stays valid
+    after a fresh clone or deployment.
+    """
+    sqlite_path = os.path.join(chroma_path, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return None
+    try:
+        with closing(sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)) as db:
+            collections = sorted(row[0] for row in db.execute("SELECT id FROM collections"))
+            count, max_seq_id = db.execute("SELECT COUNT(*), MAX(seq_id) FROM embeddings").fetchone()
+    except sqlite3.Error:
+        # Not a readable database (e.g. a Git LFS pointer): fall back to its content
+        with open(sqlite_path, "rb") as f:
+            return "sha1:" + hashlib.sha1(f.read()).hexdigest()
+    if isinstance(max_seq_id, bytes):
+        max_seq_id = max_seq_id.hex()
+    return f"{','.join(collections)}:{count}:{max_seq_id}"
+
+
+def keyword_index_fingerprint(keyword_index_path):
+    """
+    Content fingerprint of a Whoosh index: the TOC generation plus the names
+    and sizes of its segment files (all stable across checkouts).
+    """
+    if not os.path.isdir(keyword_index_path):
+        return None
+    parts = []
+    for name in sorted(os.listdir(keyword_index_path)):
+        if name.endswith((".toc", ".seg")):
+            parts.append(f"{name}:{os.path.getsize(os.path.join(keyword_index_path, name))}")
+    return ",".join(parts)
+
+
+def index_version(chroma_path, keyword_index_path, settings=None):
+    """
+    Fingerprint of the indexes (and retrieval settings) a warm cache was built against.
+
+    Parameters:
+        chroma_path (str): Path to the Chroma database.
+        keyword_index_path (str): Path to the Whoosh index.
+        settings (dict, optional): Retrieval settings that change results, e.g. page aggregation.
+
+    Returns:
+        str: Short hash that changes whenever one of the indexes is rebuilt, but
+        not when the same indexes are checked out again.
+    """
+    parts = [
+        f"format={WARM_CACHE_FORMAT}",
+        json.dumps(settings or {}, sort_keys=True),
+        f"chroma={chroma_fingerprint(chroma_path)}",
+        f"whoosh={keyword_index_fingerprint(keyword_index_path)}",
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _stem(word):
+    """Strips plural endings, so "parameters" matches "parameter"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def query_terms(query):
+    """Content words of a query, without the "Task N:" prefix of the study tasks and stop words."""
+    words = _WORD.findall(_TASK_PREFIX.sub("", normalize_query(query)))
+    return frozenset(_stem(word) for word in words if word not in STOP_WORDS)
+
+
+def similarity(a, b):
+    """Jaccard similarity of two term sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class WarmCache:
+    """
+    Precomputed retrieval results (and optionally answers) for the known study tasks.
+
+    Lookups match paraphrases of a task by the overlap of their content words;
+    retrieval results are reused from `min_similarity` on, stored answers only
+    from `min_answer_similarity`. The default of 0.25 was measured on hand-written
+    paraphrases of the five tasks: 18 of 20 score 0.29 or more (the other two
+    share almost no words with the task), other course questions 0.19 at most.
+    Questions on a task's own topic (e.g. "How is a finite-state automaton
+    defined?", 0.36) match as well; they get the task's documents, not its answer.
+    """
+
+    def __init__(self, version, entries=None, min_similarity=0.25, min_answer_similarity=0.9):
+        """
+        Parameters:
+            version (str): Index version the entries were computed against (see `index_version`).
+            entries (List[dict], optional): Entries with query, search_mode, filters, k, docs and answer.
+            min_similarity (float): Minimum query similarity to reuse retrieval results.
+            min_answer_similarity (float): Minimum query similarity to reuse a stored answer.
+        """
+        self.version = version
+        self.entries = entries or []
+        self.min_similarity = min_similarity
+        self.min_answer_similarity = min_answer_similarity
+        self._index = {}
+        for entry in self.entries:
+            self._add_to_index(entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _add_to_index(self, entry):
+        key = (entry["search_mode"], filters_key(entry["filters"]), entry["k"])
+        self._index.setdefault(key, []).append((query_terms(entry["query"]), entry))
+
+    def add(self, query, search_mode, filters, k, docs, answer=None):
+        entry = {
+            "query": query,
+            "search_mode": search_mode,
+            "filters": filters,
+            "k": k,
+            "docs": docs,
+            "answer": answer,
+        }
+        self.entries.append(entry)
+        self._add_to_index(entry)
+
+    def lookup(self, query, search_mode, filters, k):
+        """
+        Returns the precomputed results for a task paraphrase.
+
+        Returns:
+            Tuple[List[Document], str] or None: Documents and the stored answer
+            (None unless the query is close enough to reuse it).
+        """
+        terms = query_terms(query)
+        best, best_score = None, 0.0
+        for entry_terms, entry in self._index.get((search_mode, filters_key(filters), k), []):
+            score = similarity(terms, entry_terms)
+            if score > best_score:
+                best, best_score = entry, score
+        with self._lock:
+            if best is None or best_score < self.min_similarity:
+                self.misses += 1
+                return None
+            self.hits += 1
+        answer = best["answer"] if best_score >= self.min_answer_similarity else None
+        return best["docs"], answer
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self, path):
+        data = {
+            "format": WARM_CACHE_FORMAT,
+            "version": self.version,
+            "entries": [
+                dict(entry, docs=[
+                    {"page_content": d.page_content, "metadata": metadata_to_json(d.metadata)} for d in entry["docs"]
+                ])
+                for entry in self.entries
+            ],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path, expected_version):
+        """
+        Loads a warm cache artifact.
+
+        Returns:
+            WarmCache or None: None if the file is missing, unreadable or was built
+            against other indexes.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != WARM_CACHE_FORMAT or data.get("version") != expected_version:
+                logger.warning("Ignoring stale warm cache %s (built for index version %s).", path, data.get("version"))
+                return None
+            entries = [
+                dict(entry, docs=[
+                    Document(page_content=d["page_content"], metadata=metadata_from_json(d["metadata"]))
+                    for d in entry["docs"]
+                ])
+                for entry in data["entries"]
+            ]
+            return cls(data["version"], entries)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Ignoring unreadable warm cache %s: %s", path, e)
+            return None
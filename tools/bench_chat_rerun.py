@@ -0,0 +1,84 @@
+"""
+Measures Streamlit rerun time of the chat interface against chat history length.
+
+Runs `handle_chat_interaction` headless via streamlit's AppTest with a stub
+vector store and a pre-filled history, and reports the median rerun time and
+the history render time recorded in `st.session_state.render_timings`.
+By default the app's HISTORY_RENDER_WINDOW is used; `--window N` overrides it
+and `--window 0` renders every exchange as its own chat message.
+
+Usage:
+    python tools/bench_chat_rerun.py --lengths 0 10 50 200 --reruns 5 [--window 0]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_SCRIPT = """
+import sys
+sys.path.append({app_dir!r})
+import streamlit as st
+import chatbot_setup
+from chatbot_setup import handle_chat_interaction
+_window = {window!r}
+if _window is not None:
+    chatbot_setup.HISTORY_RENDER_WINDOW = _window or None
+
+class _VectorStore:
+    def get(self, include=None):
+        return {{"metadatas": [
+            {{"course": f"Course {{i % 11}}", "lecture": f"Lecture {{i % 97}}", "semester": "WiSe 2023"}}
+            for i in range({metadata_size})
+        ]}}
+
+if "chat_history" not in st.session_state:
+    st.session_state.chat_history = {{0: [
+        {{"query": f"Question {{i}}?", "response": "Answer " + "lorem ipsum " * 40, "filters": {{}}}}
+        for i in range({history_length})
+    ]}}
+handle_chat_interaction(None, "rag", _VectorStore(), "Ask...", 0)
+"""
+
+
+def measure(history_length, reruns, metadata_size, window=None):
+    """Returns (median rerun seconds, median history render seconds) for one history length."""
+    script = APP_SCRIPT.format(
+        app_dir=os.path.join(BASE_DIR, "app"),
+        history_length=history_length,
+        metadata_size=metadata_size,
+        window=window
+    )
+    app = AppTest.from_string(script, default_timeout=60)
+    app.run()  # warm-up: fills caches
+    rerun_times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        rerun_times.append(time.perf_counter() - start)
+    render_times = [seconds for _, seconds in app.session_state["render_timings"][1:]]
+    return statistics.median(rerun_times), statistics.median(render_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[0, 10, 50, 200])
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--metadata-size", type=int, default=20000)
+    parser.add_argument("--window", type=int, default=None, help="Render window (default: the app's, 0 = full history)")
+    args = parser.parse_args()
+
+    print(f"{'history':>8} {'rerun_ms':>10} {'render_ms':>10}")
+    for length in args.lengths:
+        rerun, render = measure(length, args.reruns, args.metadata_size, args.window)
+        print(f"{length:>8} {rerun * 1000:>10.1f} {render * 1000:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Deterministic checks of the LLM scheduler: priority order, rate buckets,
+deadline expiry and the queue-time percentiles.
+
+Time is simulated with a fake clock and an injected wait, so the checks do
+not sleep and do not depend on machine speed. Exits non-zero if a check fails.
+
+Usage:
+    python tools/check_scheduler.py
+"""
+import os
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from retrieval.deadline import Deadline  # noqa: E402
+from retrieval.llm_scheduler import (  # noqa: E402
+    LLMScheduler, PRIORITY_ANSWER, PRIORITY_EMBEDDING, PRIORITY_MULTIQUERY
+)
+
+
+class FakeClock:
+    """Clock that only moves when a timed wait is simulated."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, condition, timeout):
+        # Timed waits (rate limits, deadlines) advance the clock instantly;
+        # untimed waits block until another thread notifies the condition.
+        if timeout is None:
+            condition.wait()
+        else:
+            self.now += timeout
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_request_bucket():
+    """A second request within the same minute waits exactly one refill interval."""
+    clock = FakeClock()
+    scheduler = LLMScheduler(requests_per_minute=60, clock=clock, wait=clock.wait)
+    scheduler.request_bucket.level = 1  # one request left in the burst
+    scheduler.submit(lambda: None)
+    scheduler.submit(lambda: None)
+    check(abs(clock.now - 1.0) < 1e-9, f"expected 1.0s of simulated waiting, got {clock.now}")
+
+
+def check_token_bucket():
+    """A call is held back until the token bucket has refilled enough for it."""
+    clock = FakeClock()
+    scheduler = LLMScheduler(tokens_per_minute=600, clock=clock, wait=clock.wait)
+    scheduler.submit(lambda: None, tokens=600)  # empties the bucket
+    scheduler.submit(lambda: None, tokens=100)  # 10 tokens per second
+    check(abs(clock.now - 10.0) < 1e-9, f"expected 10.0s of simulated waiting, got {clock.now}")
+
+
+def check_expiry():
+    """Calls whose deadline has passed, or is too close, are rejected without using capacity."""
+    clock = FakeClock()
+    scheduler = LLMScheduler(clock=clock, wait=clock.wait)
+    deadline = Deadline(1.0, clock=clock)
+    clock.now = 2.0
+    try:
+        scheduler.submit(lambda: None, deadline=deadline)
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("expired call was admitted")
+    # Not passed yet, but too little time left to finish the call
+    deadline = Deadline(5.0, clock=clock)
+    clock.now += 4.5
+    try:
+        scheduler.submit(lambda: None, deadline=deadline, min_remaining=1.0)
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("call without enough remaining time was admitted")
+    stats = scheduler.stats()
+    check(stats["expired"] == 2 and stats["in_flight"] == 0, f"unexpected stats after expiry: {stats}")
+
+
+def check_priority_order():
+    """With the only slot busy, queued calls are admitted answer > embedding > multiquery."""
+    scheduler = LLMScheduler(max_concurrency=1)
+    release = threading.Event()
+    order = []
+    blocker = threading.Thread(target=scheduler.submit, args=(release.wait,))
+    blocker.start()
+    while scheduler.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+
+    threads = []
+    for priority in (PRIORITY_MULTIQUERY, PRIORITY_EMBEDDING, PRIORITY_ANSWER):
+        depth = scheduler.queue_depth()
+        thread = threading.Thread(target=scheduler.submit, args=(lambda p=priority: order.append(p), priority))
+        thread.start()
+        threads.append(thread)
+        while scheduler.queue_depth() == depth:  # enqueue one after another
+            time.sleep(0.001)
+
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join(timeout=5)
+    expected = [PRIORITY_ANSWER, PRIORITY_EMBEDDING, PRIORITY_MULTIQUERY]
+    check(order == expected, f"admission order {order}, expected {expected}")
+
+
+def check_p95():
+    """p95 uses the nearest rank, so with two samples it is the larger one."""
+    scheduler = LLMScheduler()
+    scheduler._waits[PRIORITY_ANSWER].extend([0.1, 3.0])
+    p95 = scheduler.stats()["priorities"]["answer"]["p95_wait"]
+    check(p95 == 3.0, f"p95 of [0.1, 3.0] is {p95}, expected 3.0")
+
+
+CHECKS = [check_request_bucket, check_token_bucket, check_expiry, check_priority_order, check_p95]
+
+
+def main():
+    failed = 0
+    for fn in CHECKS:
+        try:
+            fn()
+            print(f"ok    {fn.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL  {fn.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""
+Retrieval quality and speed regression suite.
+
+Runs the study tasks plus the labeled queries in tools/eval_queries.json
+through every retrieval configuration and reports recall@k, MRR and nDCG@k
+next to retrieval latency and prompt-token counts, so speed changes (caches,
+adaptive k, page aggregation, ...) can be checked against answer grounding.
+
+Query embeddings go through a local embedding cache. Fill it once with
+`--embeddings openai`; afterwards the default `--embeddings cache` runs
+fully offline (a missing embedding is reported as an error and fails the
+run, like any other failed query). Configurations
+that need the LLM (multiquery) only run with `--embeddings openai`.
+
+Labels are checked against the sources in the index before anything runs; a
+label that matches no indexed source fails the run. Course-level labels
+saturate recall@k and hide ranking regressions, so they also fail the run
+unless `--allow-course-labels` is given. `--draft-labels` writes page-level
+labels proposed from the top hits inside the current labels, to be reviewed
+by hand and copied into the queries file.
+
+The "app" configurations run retrieval with every feature the app uses
+(multiquery, page aggregation and adaptive k), so the gate covers what
+participants actually get.
+
+Usage:
+    python tools/evaluate_retrieval.py --embeddings openai --save-baseline eval_baseline.json
+    python tools/evaluate_retrieval.py --baseline eval_baseline.json
+    python tools/evaluate_retrieval.py --draft-labels eval_queries.draft.json
+    python tools/evaluate_retrieval.py --allow-course-labels --configs app_keyword
+
+New modes are evaluated by adding an entry to CONFIGS.
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "app"))
+
+from retrieval.answer_generator import AnswerGenerator  # noqa: E402
+from retrieval.llm_scheduler import estimate_tokens  # noqa: E402
+from retrieval.pipeline_config import create_pipeline, CHROMA_PATH, KEYWORD_INDEX_PATH  # noqa: E402
+from retrieval.source_ref import SourceRef  # noqa: E402
+from study_setup import TASKS  # noqa: E402
+
+DEFAULT_QUERIES_PATH = os.path.join(BASE_DIR, "tools", "eval_queries.json")
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, ".embedding_cache")
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Retrieval configurations. "needs_llm" marks configurations that cannot run offline.
+CONFIGS = {
+    "app": {"search_mode": "rag", "multiquery": True, "aggregate_pages": True, "adaptive_k": True,
+            "needs_llm": True},
+    "app_keyword": {"search_mode": "keyword", "aggregate_pages": True, "adaptive_k": True},
+    "rag": {"search_mode": "rag", "multiquery": True, "needs_llm": True},
+    "rag_single": {"search_mode": "rag", "multiquery": False},
+    "rag_pages": {"search_mode": "rag", "multiquery": False, "aggregate_pages": True},
+    "rag_adaptive": {"search_mode": "rag", "multiquery": False, "adaptive_k": True},
+    "keyword": {"search_mode": "keyword"},
+    "keyword_pages": {"search_mode": "keyword", "aggregate_pages": True},
+    "keyword_adaptive": {"search_mode": "keyword", "adaptive_k": True},
+}
+
+
+class CacheOnlyEmbeddings(Embeddings):
+    """Underlying embeddings for offline runs: every cache miss is an error."""
+
+    def embed_documents(self, texts):
+        raise LookupError(f"{len(texts)} embedding(s) not cached; run once with --embeddings openai.")
+
+    def embed_query(self, text):
+        raise LookupError(f"Query embedding not cached: {text[:60]!r}; run once with --embeddings openai.")
+
+
+def load_queries(path):
+    """
+    Returns the labeled queries: the study tasks followed by the extra queries.
+
+    Returns:
+        List[dict]: Dicts with "query" and "relevant" (list of metadata label dicts);
+        study tasks also carry their number in "task".
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    queries = [
+        {"query": task, "task": str(i + 1), "relevant": data.get("tasks", {}).get(str(i + 1), [])}
+        for i, task in enumerate(TASKS)
+    ]
+    queries.extend(data.get("queries", []))
+    return [q for q in queries if q["relevant"]]
+
+
+def page_range(page):
+    """Parses "12" or "10-12" into an inclusive (start, end) range, or None."""
+    try:
+        parts = [int(p) for p in str(page).replace(" ", "").split("-")]
+    except ValueError:
+        return None
+    return parts[0], parts[-1]
+
+
+def label_matches(metadata, label):
+    ref = SourceRef.from_metadata(metadata)
+    for field, expected in label.items():
+        if field == "page":
+            actual = ref.page
+            expected_range, actual_range = page_range(expected), page_range(actual)
+            if expected_range and actual_range:
+                if expected_range[1] < actual_range[0] or actual_range[1] < expected_range[0]:
+                    return False
+            elif str(expected) != str(actual):
+                return False
+        elif getattr(ref, field, metadata.get(field)) != expected:
+            return False
+    return True
+
+
+def indexed_sources(vectorstore):
+    """Returns the distinct sources (SourceRef) of all chunks in the vector store."""
+    metadatas = vectorstore.get(include=["metadatas"])["metadatas"]
+    return {SourceRef.from_metadata(metadata) for metadata in metadatas}
+
+
+def validate_labels(queries, sources):
+    """
+    Checks every label against the indexed sources.
+
+    A misspelled course or lecture would make baseline and candidate both score
+    0 for that query and hide regressions, so every label must match at least
+    one indexed source.
+
+    Returns:
+        List[str]: One message per label that matches no source.
+    """
+    courses = {ref.course for ref in sources}
+    lectures = {ref.lecture for ref in sources}
+    sources = [ref.as_dict() for ref in sources]
+    problems = []
+    for labeled in queries:
+        for label in labeled["relevant"]:
+            if any(label_matches(source, label) for source in sources):
+                continue
+            if "course" in label and label["course"] not in courses:
+                reason = f"unknown course {label['course']!r}"
+            elif "lecture" in label and label["lecture"] not in lectures:
+                reason = f"unknown lecture {label['lecture']!r}"
+            else:
+                reason = "no indexed source matches all fields"
+            problems.append(f"{labeled['query'][:40]!r}: {label}: {reason}")
+    return problems
+
+
+def draft_labels(pipeline, queries, k):
+    """
+    Proposes page-level labels for the queries file.
+
+    The top-k hits of keyword and single-query RAG retrieval that fall inside a
+    query's current labels are turned into (course, lecture, page) labels. They
+    are only a starting point and must be reviewed before they replace the labels.
+
+    Returns:
+        dict: Queries file content in the format of tools/eval_queries.json.
+    """
+    pipeline.page_aggregator = None
+    pipeline.adaptive_k = None
+    tasks, extra = {}, []
+    for labeled in queries:
+        proposed = []
+        for search_mode in ("keyword", "rag"):
+            try:
+                docs = pipeline.retrieve(labeled["query"], search_mode, None, False, k)
+            except Exception as e:
+                print(f"  error: {labeled['query'][:40]!r} ({search_mode}): {e}", file=sys.stderr)
+                continue
+            for doc in docs:
+                if not any(label_matches(doc.metadata, label) for label in labeled["relevant"]):
+                    continue
+                ref = SourceRef.from_metadata(doc.metadata)
+                label = {"course": ref.course, "lecture": ref.lecture, "page": ref.page}
+                if label not in proposed:
+                    proposed.append(label)
+        relevant = proposed or labeled["relevant"]
+        if "task" in labeled:
+            tasks[labeled["task"]] = relevant
+        else:
+            extra.append({"query": labeled["query"], "relevant": relevant})
+    return {"tasks": tasks, "queries": extra}
+
+
+def label_levels(queries):
+    """Counts labels by their most specific field (course, lecture or page)."""
+    levels = {"course": 0, "lecture": 0, "page": 0}
+    for labeled in queries:
+        for label in labeled["relevant"]:
+            level = "page" if "page" in label else "lecture" if "lecture" in label else "course"
+            levels[level] += 1
+    return levels
+
+
+def score_ranking(docs, relevant, k):
+    """
+    Computes recall@k, reciprocal rank and nDCG@k with binary relevance.
+
+    recall@k is the fraction of labels matched by at least one of the top-k
+    documents. For nDCG the ideal ranking has min(k, max(#labels, #relevant hits))
+    relevant documents.
+    """
+    top = docs[:k]
+    hits = [any(label_matches(doc.metadata, label) for label in relevant) for doc in top]
+    recall = sum(
+        any(label_matches(doc.metadata, label) for doc in top) for label in relevant
+    ) / len(relevant)
+    reciprocal_rank = next((1.0 / (i + 1) for i, hit in enumerate(hits) if hit), 0.0)
+    dcg = sum(1.0 / math.log2(i + 2) for i, hit in enumerate(hits) if hit)
+    ideal = min(k, max(len(relevant), sum(hits)))
+    idcg = sum(1.0 / math.log2(i + 2) for i in range(ideal))
+    return recall, reciprocal_rank, dcg / idcg if idcg else 0.0
+
+
+@functools.lru_cache(maxsize=1)
+def _gpt4o_encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception:  # tiktoken missing or its encoding cannot be downloaded offline
+        return None
+
+
+def count_tokens(text):
+    """Counts gpt-4o tokens with tiktoken if its encoding is available, else estimates."""
+    encoding = _gpt4o_encoding()
+    return len(encoding.encode(text)) if encoding else estimate_tokens(text)
+
+
+def evaluate_config(pipeline, config, queries, k, adaptive_k, page_aggregator):
+    """Runs all queries through one configuration and returns aggregated metrics."""
+    pipeline.page_aggregator = page_aggregator if config.get("aggregate_pages") else None
+    pipeline.adaptive_k = adaptive_k if config.get("adaptive_k") else None
+    prompt_builder = AnswerGenerator(pipeline.model)
+
+    recalls, rrs, ndcgs, latencies, prompt_tokens, doc_counts, errors = [], [], [], [], [], [], []
+    for labeled in queries:
+        start = time.perf_counter()
+        try:
+            docs, _ = pipeline.retrieve_with_info(
+                labeled["query"], config["search_mode"], None, config.get("multiquery", False), k
+            )
+        except Exception as e:
+            errors.append(f"{labeled['query'][:40]!r}: {e}")
+            continue
+        latencies.append(time.perf_counter() - start)
+        recall, rr, ndcg = score_ranking(docs, labeled["relevant"], k)
+        recalls.append(recall)
+        rrs.append(rr)
+        ndcgs.append(ndcg)
+        doc_counts.append(len(docs))
+        prompt_tokens.append(count_tokens(prompt_builder.build_prompt(labeled["query"], docs)))
+
+    def mean(values):
+        return statistics.fmean(values) if values else 0.0
+
+    return {
+        f"recall@{k}": mean(recalls),
+        "mrr": mean(rrs),
+        f"ndcg@{k}": mean(ndcgs),
+        "latency_p50": statistics.median(latencies) if latencies else 0.0,
+        "latency_max": max(latencies, default=0.0),
+        "prompt_tokens": mean(prompt_tokens),
+        "docs": mean(doc_counts),
+        "queries": len(latencies),
+        "errors": errors,
+    }
+
+
+def compare_to_baseline(results, baseline, max_quality_drop, max_latency_factor):
+    """Returns regression messages for metrics that got worse than the tolerances allow."""
+    regressions = []
+    for name, metrics in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        for metric, value in metrics.items():
+            if metric.startswith(("recall", "mrr", "ndcg")) and value < old.get(metric, 0.0) - max_quality_drop:
+                regressions.append(f"{name}: {metric} {old[metric]:.3f} -> {value:.3f}")
+        if old.get("latency_p50") and metrics["latency_p50"] > old["latency_p50"] * max_latency_factor:
+            regressions.append(f"{name}: latency_p50 {old['latency_p50']:.3f}s -> {metrics['latency_p50']:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH)
+    parser.add_argument("--configs", nargs="+", default=None, help=f"Subset of {', '.join(CONFIGS)}")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embeddings", choices=["cache", "openai"], default="cache",
+                        help="cache: offline, cached query embeddings only; openai: fill the cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--baseline", help="Fail if results regress against this results file")
+    parser.add_argument("--save-baseline", help="Write the results to this file")
+    parser.add_argument("--max-quality-drop", type=float, default=0.02)
+    parser.add_argument("--max-latency-factor", type=float, default=1.5)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--keyword-index-path", default=KEYWORD_INDEX_PATH)
+    parser.add_argument("--draft-labels", help="Write proposed page-level labels to this file and exit")
+    parser.add_argument("--allow-course-labels", action="store_true",
+                        help="Run even if some labels only name a course (results are not a reliable gate)")
+    args = parser.parse_args()
+
+    online = args.embeddings == "openai"
+    model = None
+    if online:
+        import streamlit as st
+        from langchain_openai import OpenAIEmbeddings
+        underlying = OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=st.secrets["openAI"]["open_ai_key"])
+    else:
+        underlying = CacheOnlyEmbeddings()
+        model = FakeListChatModel(responses=[""])
+    embeddings = CacheBackedEmbeddings.from_bytes_store(
+        underlying, LocalFileStore(args.cache_dir), namespace=EMBEDDING_MODEL, query_embedding_cache=True
+    )
+
+    # The app's configuration; each entry of CONFIGS switches its features on or off
+    pipeline = create_pipeline(args.chroma_path, args.keyword_index_path, embedding_model=embeddings, model=model)
+    page_aggregator = pipeline.page_aggregator
+    adaptive_k = pipeline.adaptive_k
+    queries = load_queries(args.queries)
+
+    problems = validate_labels(queries, indexed_sources(pipeline.vectorstore))
+    for problem in problems:
+        print(f"INVALID LABEL {problem}", file=sys.stderr)
+    if problems:
+        return 2
+
+    if args.draft_labels:
+        with open(args.draft_labels, "w", encoding="utf-8") as f:
+            json.dump(draft_labels(pipeline, queries, args.k), f, ensure_ascii=False, indent=2)
+        print(f"Wrote proposed labels for {len(queries)} queries to {args.draft_labels}; review them before use.")
+        return 0
+
+    levels = label_levels(queries)
+    print("labels: " + ", ".join(f"{count} {level}-level" for level, count in levels.items()))
+    if levels["course"]:
+        print(f"WARNING: {levels['course']} course-level label(s) saturate recall@{args.k} and hide ranking "
+              "regressions; add lecture and page labels (see --draft-labels)", file=sys.stderr)
+        if not args.allow_course_labels:
+            return 2
+
+    names = args.configs or [name for name, config in CONFIGS.items() if online or not config.get("needs_llm")]
+    results = {}
+    print(f"{'config':18} {'recall':>7} {'mrr':>6} {'ndcg':>6} {'p50_ms':>8} {'tokens':>7} {'docs':>5}")
+    for name in names:
+        metrics = evaluate_config(pipeline, CONFIGS[name], queries, args.k, adaptive_k, page_aggregator)
+        results[name] = metrics
+        print(f"{name:18} {metrics[f'recall@{args.k}']:>7.3f} {metrics['mrr']:>6.3f} "
+              f"{metrics[f'ndcg@{args.k}']:>6.3f} {metrics['latency_p50'] * 1000:>8.1f} "
+              f"{metrics['prompt_tokens']:>7.0f} {metrics['docs']:>5.1f}")
+        for error in metrics["errors"]:
+            print(f"  error: {error}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [name for name, metrics in results.items() if metrics["errors"]]
+    if failed:
+        print(f"FAILED queries in: {', '.join(failed)}", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.max_quality_drop, args.max_latency_factor)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Replays exported study logs against the Pipeline to load-test it offline.
+
+Every log file written by `export_logs_github` holds one participant's
+task interactions (queries, filters and the assigned method). Each simulated
+participant replays one session, waiting between queries as in the original
+session divided by `--speed` (0 = no waiting). Log entries are only
+timestamped per task, so the queries of a task are spread evenly between the
+previous entry and the task's own timestamp.
+
+The pipeline is built with the app's configuration (retrieval settings,
+scheduler limits, warm cache) and queries run with the app's time budget.
+Embeddings and the chat model are replaced by deterministic stand-ins, so no
+API key or network access is needed; `--llm-latency` simulates provider time.
+
+Usage:
+    python tools/replay_sessions.py logs/*.json --participants 20 --speed 10
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from langchain_core.embeddings.fake import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "app"))
+
+from retrieval.pipeline_config import create_pipeline, CHROMA_PATH, KEYWORD_INDEX_PATH, WARM_CACHE_PATH  # noqa: E402
+from chatbot_setup import QUERY_TIME_BUDGET  # noqa: E402
+
+STAND_IN_RESPONSE = (
+    "What does the lecture say about this?\n"
+    "Which course covers this topic?\n"
+    "How is this concept defined?\n"
+    "Explain this concept."
+)
+
+
+class StandInChatModel(FakeListChatModel):
+    """Fake chat model that answers after a fixed delay."""
+
+    latency: float = 0.0
+
+    def _call(self, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return super()._call(*args, **kwargs)
+
+
+def unflatten_filters(flat_filters):
+    """Turns logged filters ({"lecture": [...]}) back into pipeline filters."""
+    filters = {
+        key: {"$in": list(value)} if isinstance(value, (list, tuple)) else value
+        for key, value in (flat_filters or {}).items()
+        if value
+    }
+    return filters or None
+
+
+def load_sessions(paths):
+    """
+    Reads exported log files into replayable sessions.
+
+    Returns:
+        List[dict]: One dict per participant with "study_id" and "events", a list of
+        (offset seconds, query, method, filters) tuples sorted by offset.
+    """
+    sessions = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in sorted(entries, key=lambda e: e.get("timestamp", "")):
+            study_id = entry.get("study_id", path)
+            session = sessions.setdefault(study_id, {"study_id": study_id, "events": [], "last": None, "start": None})
+            timestamp = datetime.fromisoformat(entry["timestamp"]) if "timestamp" in entry else None
+            if session["start"] is None and timestamp is not None:
+                session["start"] = timestamp
+
+            interactions = entry.get("queries_and_responses") or []
+            if interactions and entry.get("type") in ("task_interaction", "free_exploration"):
+                method = entry.get("method") or "rag"
+                begin = session["last"] or session["start"] or timestamp
+                span = (timestamp - begin).total_seconds() if timestamp and begin else 0.0
+                base = (begin - session["start"]).total_seconds() if begin and session["start"] else 0.0
+                step = span / len(interactions)
+                for i, interaction in enumerate(interactions):
+                    session["events"].append((
+                        base + step * i,
+                        interaction["query"],
+                        method,
+                        unflatten_filters(interaction.get("filters"))
+                    ))
+            if timestamp is not None:
+                session["last"] = timestamp
+
+    return [
+        {"study_id": session["study_id"], "events": sorted(session["events"], key=lambda e: e[0])}
+        for session in sessions.values() if session["events"]
+    ]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Replayer:
+    """
+    Replays sessions concurrently against one shared Pipeline and collects metrics.
+    """
+
+    def __init__(self, pipeline, speed=1.0, time_budget=None):
+        """
+        Parameters:
+            pipeline (Pipeline): The pipeline under test (shared, as in the app).
+            speed (float): Replay speed multiplier; 0 replays without waiting.
+            time_budget (float, optional): Per-query time budget passed to the pipeline.
+        """
+        self.pipeline = pipeline
+        self.speed = speed
+        self.time_budget = time_budget
+        self.results = []
+        self._lock = threading.Lock()
+
+    def replay_session(self, session):
+        start = time.monotonic()
+        for offset, query, method, filters in session["events"]:
+            if self.speed:
+                delay = offset / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            query_start = time.monotonic()
+            error = None
+            degradations = []
+            try:
+                response = self.pipeline.process_query(query, method, filters, time_budget=self.time_budget)
+                degradations = response.degradations
+            except Exception as e:
+                error = repr(e)
+            with self._lock:
+                self.results.append({
+                    "method": method,
+                    "latency": time.monotonic() - query_start,
+                    "error": error,
+                    "degradations": degradations,
+                })
+
+    def run(self, sessions, participants):
+        """Replays `participants` sessions concurrently (cycling through `sessions`)."""
+        threads = [
+            threading.Thread(target=self.replay_session, args=(sessions[i % len(sessions)],), daemon=True)
+            for i in range(participants)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - start
+
+    def report(self, wall_time):
+        latencies = [r["latency"] for r in self.results]
+        by_method = {}
+        for result in self.results:
+            by_method.setdefault(result["method"], []).append(result["latency"])
+        return {
+            "queries": len(self.results),
+            "errors": sum(1 for r in self.results if r["error"]),
+            "wall_time": wall_time,
+            "throughput_qps": len(self.results) / wall_time if wall_time else 0.0,
+            "latency": {
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies, default=0.0),
+                "mean": statistics.fmean(latencies) if latencies else 0.0,
+            },
+            "latency_p95_by_method": {method: percentile(values, 0.95) for method, values in by_method.items()},
+            "degradations": dict(Counter(d for r in self.results for d in r["degradations"])),
+            "caches": self.pipeline.cache_stats(),
+            "scheduler": self.pipeline.scheduler_stats(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="Exported log files or glob patterns")
+    parser.add_argument("--participants", type=int, default=10, help="Concurrent simulated participants")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (0 = no waiting)")
+    parser.add_argument("--time-budget", type=float, default=QUERY_TIME_BUDGET,
+                        help="Per-query time budget in seconds (default: the app's)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Simulated seconds per LLM call")
+    parser.add_argument("--embedding-size", type=int, default=3072, help="Must match the Chroma collection")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--keyword-index-path", default=KEYWORD_INDEX_PATH)
+    parser.add_argument("--warm-cache-path", default=WARM_CACHE_PATH)
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.logs for path in glob.glob(pattern)})
+    sessions = load_sessions(paths)
+    if not sessions:
+        print("No replayable sessions found.", file=sys.stderr)
+        return 1
+
+    pipeline = create_pipeline(
+        args.chroma_path,
+        args.keyword_index_path,
+        embedding_model=DeterministicFakeEmbedding(size=args.embedding_size),
+        model=StandInChatModel(responses=[STAND_IN_RESPONSE], latency=args.llm_latency),
+        warm_cache_path=args.warm_cache_path
+    )
+    replayer = Replayer(pipeline, speed=args.speed, time_budget=args.time_budget)
+    wall_time = replayer.run(sessions, args.participants)
+    print(json.dumps(replayer.report(wall_time), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Precomputes retrieval results (and optionally answers) for the study tasks.
+
+For every task in `study_setup.TASKS`, both search methods and each filter
+combination, the results are computed with the real pipeline and written to a
+warm cache artifact stamped with the current index version. The app loads the
+artifact at startup, so the first query per task is answered from the cache
+when it is a close paraphrase of the task text. Rebuilding an index changes
+the version and the stale artifact is ignored until this job is run again.
+
+Usage:
+    python tools/warm_cache.py --with-answers --filters-from-logs "logs/*.json" --top-filters 5
+"""
+import argparse
+import glob
+import os
+import sys
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "app"))
+
+from retrieval.pipeline_config import create_pipeline, CHROMA_PATH, KEYWORD_INDEX_PATH, WARM_CACHE_PATH  # noqa: E402
+from retrieval.result_cache import filters_key  # noqa: E402
+from retrieval.warm_cache import WarmCache  # noqa: E402
+from study_setup import TASKS  # noqa: E402
+from replay_sessions import load_sessions  # noqa: E402
+
+
+def common_filters(log_paths, top_n):
+    """Returns the `top_n` most frequent non-empty filter combinations in the study logs."""
+    counts = Counter()
+    examples = {}
+    for session in load_sessions(log_paths):
+        for _, _, _, filters in session["events"]:
+            if filters:
+                key = filters_key(filters)
+                counts[key] += 1
+                examples[key] = filters
+    return [examples[key] for key, _ in counts.most_common(top_n)]
+
+
+def build_warm_cache(pipeline, tasks, filter_sets, methods=("rag", "keyword"), k=5, with_answers=False):
+    """
+    Computes a WarmCache for all combinations of task, method and filters.
+
+    Parameters:
+        pipeline (Pipeline): Pipeline used to compute the results.
+        tasks (List[str]): Task texts.
+        filter_sets (List[dict]): Filter combinations (None for no filter).
+        methods (Iterable[str]): Search modes to precompute.
+        k (int): Number of documents, must match what the app requests.
+        with_answers (bool): Also generate and store answers.
+    """
+    cache = WarmCache(pipeline.index_version)
+    for task in tasks:
+        for method in methods:
+            for filters in filter_sets:
+                docs = pipeline.retrieve(task, method, filters, multiquery=True, k=k)
+                answer = None
+                if with_answers and docs:
+                    response = pipeline.answer(task, docs)
+                    answer = response.content if hasattr(response, "content") else str(response)
+                cache.add(task, method, filters, k, docs, answer)
+                print(f"{method:8} {len(docs):2} docs  filters={filters}  {task[:50]}")
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=WARM_CACHE_PATH)
+    parser.add_argument("--with-answers", action="store_true", help="Also precompute answers")
+    parser.add_argument("--filters-from-logs", nargs="*", default=[], help="Study logs to take filter combinations from")
+    parser.add_argument("--top-filters", type=int, default=5)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--keyword-index-path", default=KEYWORD_INDEX_PATH)
+    args = parser.parse_args()
+
+    log_paths = sorted({path for pattern in args.filters_from_logs for path in glob.glob(pattern)})
+    filter_sets = [None] + common_filters(log_paths, args.top_filters)
+
+    # Same settings as the app, so the artifact's index version matches at startup
+    pipeline = create_pipeline(args.chroma_path, args.keyword_index_path)
+    cache = build_warm_cache(pipeline, TASKS, filter_sets, k=args.k, with_answers=args.with_answers)
+    cache.save(args.output)
+    print(f"Wrote {len(cache.entries)} entries for index version {cache.version} to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())